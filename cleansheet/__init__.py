@@ -0,0 +1,51 @@
+"""CleanSheet Matching Engine.
+
+The matching engine is importable on its own (``cleansheet.engine``) and
+does not pull in Streamlit, NLTK or pandas at import time. The pandas
+pipeline lives in ``cleansheet.pipeline``.
+"""
+
+from .config import DEFAULT_CONFIG, MatchConfig
+from .engine import (
+    FeatureCache,
+    GroupProfile,
+    ProductFeatures,
+    calculate_token_similarity,
+    check_size_conflict,
+    check_variant_conflict,
+    create_standardized_mapping,
+    extract_brand,
+    extract_size_info,
+    extract_size_unit,
+    extract_tokens,
+    extract_variant_info,
+    extract_variant_tokens,
+    group_similar_products,
+    preprocess_text,
+    standardize_groups,
+    standardize_product_name,
+)
+from .profiling import RunProfile
+
+__all__ = [
+    'DEFAULT_CONFIG',
+    'FeatureCache',
+    'GroupProfile',
+    'MatchConfig',
+    'ProductFeatures',
+    'RunProfile',
+    'calculate_token_similarity',
+    'check_size_conflict',
+    'check_variant_conflict',
+    'create_standardized_mapping',
+    'extract_brand',
+    'extract_size_info',
+    'extract_size_unit',
+    'extract_tokens',
+    'extract_variant_info',
+    'extract_variant_tokens',
+    'group_similar_products',
+    'preprocess_text',
+    'standardize_groups',
+    'standardize_product_name',
+]
@@ -0,0 +1,7 @@
+"""Allow ``python -m cleansheet``."""
+
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,374 @@
+"""Benchmark the matching stages on synthetic catalogs of any size.
+
+:func:`synthetic_catalog` builds noisy label lists the way ERP and till
+exports look: brand abbreviations ("Sam" for Samsung), size and unit
+spellings (330ml, 330 ml, 1L, 32in, 32 inch), variant keywords, filler
+words, case and punctuation noise. Every label belongs to a known product,
+so the benchmark also reports pair precision and recall of the grouping.
+
+:func:`run_benchmark` times each stage separately and records peak memory,
+and :func:`compare` flags stages that got slower or bigger than a saved
+baseline. From the command line::
+
+    python -m cleansheet bench --sizes 1000 10000 100000 -o bench.json
+    python -m cleansheet bench --baseline bench.json -o bench_new.json
+"""
+
+import dataclasses
+import datetime
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from .config import DEFAULT_CONFIG
+from .engine import (
+    RULE_VERSION,
+    FeatureCache,
+    GroupProfile,
+    extract_brand,
+    extract_size_info,
+    extract_size_unit,
+    extract_tokens,
+    extract_variant_info,
+    extract_variant_tokens,
+    group_similar_products,
+    score_confidence,
+    standardize_product_name,
+)
+from .pipeline import _matched_frame
+from .profiling import RunProfile
+
+# Bumped whenever the layout of the results changes
+FORMAT_VERSION = 1
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+# Brand -> spellings seen in exports
+_BRANDS = {
+    'Samsung': ('Samsung', 'Sam', 'SAMSUNG', 'Samsng'),
+    'Apple': ('Apple', 'APPLE'),
+    'Sony': ('Sony', 'SONY'),
+    'LG': ('LG', 'L.G.'),
+    'Dell': ('Dell',),
+    'HP': ('HP', 'Hewlett Packard'),
+    'Lenovo': ('Lenovo',),
+    'Coca-Cola': ('Coca-Cola', 'Coca Cola', 'Coke', 'CocaCola'),
+    'Pepsi': ('Pepsi', 'PEPSI'),
+    'Nestle': ('Nestle', 'Nestlé'),
+    'Heinz': ('Heinz',),
+}
+
+# Product type -> (brands, spellings of the type, sizes as (number, unit), variant keywords)
+_TYPES = {
+    'TV': (('Samsung', 'Sony', 'LG'), ('TV', 'Television', 'tv'),
+           (('32', 'in'), ('40', 'in'), ('50', 'in'), ('55', 'in'), ('65', 'in')), ('smart', 'basic', 'pro')),
+    'Monitor': (('Samsung', 'Dell', 'HP', 'LG'), ('Monitor', 'Display'),
+                (('24', 'in'), ('27', 'in'), ('32', 'in')), ('pro', 'ultra', 'black')),
+    'Phone': (('Apple', 'Samsung'), ('iPhone', 'Phone', 'Galaxy'),
+              (('64', 'gb'), ('128', 'gb'), ('256', 'gb')), ('pro', 'mini', 'max', 'plus')),
+    'Laptop': (('Dell', 'HP', 'Lenovo', 'Apple'), ('Laptop', 'Notebook'),
+               (('256', 'gb'), ('512', 'gb'), ('1', 'tb')), ('pro', 'lite', 'silver')),
+    'Cola': (('Coca-Cola', 'Pepsi'), ('Cola', 'Soda', ''),
+             (('330', 'ml'), ('500', 'ml'), ('1', 'l'), ('2', 'l')), ('zero', 'vanilla', 'standard')),
+    'Water': (('Nestle', 'Coca-Cola'), ('Water', 'Still Water'),
+              (('500', 'ml'), ('750', 'ml'), ('1', 'l')), ('premium', 'standard')),
+    'Coffee': (('Nestle',), ('Coffee', 'Instant Coffee'),
+               (('200', 'g'), ('500', 'g'), ('1', 'kg')), ('gold', 'premium', 'standard')),
+    'Ketchup': (('Heinz',), ('Ketchup', 'Tomato Ketchup'),
+                (('500', 'g'), ('16', 'oz')), ('lite', 'zero')),
+    'Headphones': (('Sony', 'Apple', 'Samsung'), ('Headphones', 'Earbuds'),
+                   (), ('pro', 'max', 'black', 'white')),
+}
+
+# Unit -> spellings used after the number
+_UNIT_SPELLINGS = {
+    'in': ('in', ' in', 'inch', ' inch', '"'),
+    'ml': ('ml', ' ml', 'ML', 'mL'),
+    'l': ('L', 'l', ' L', ' litre'),
+    'gb': ('GB', 'gb', ' GB'),
+    'tb': ('TB', ' TB'),
+    'g': ('g', ' g', 'G'),
+    'kg': ('kg', ' kg', 'KG'),
+    'oz': ('oz', ' oz'),
+}
+
+_FILLERS = ('New', 'Pack', 'the', 'with', 'for', 'Edition', 'UK', 'Single')
+
+_LETTERS = 'ABCDEFGHJKLMNPQRSTUVWXYZ'
+
+
+def _product(rng):
+    """Canonical description of one product: brand, type, model code, size and variant"""
+    product_type = rng.choice(list(_TYPES))
+    brands, _, sizes, variants = _TYPES[product_type]
+    return {
+        'brand': rng.choice(brands),
+        'type': product_type,
+        'model': rng.choice(_LETTERS) + str(rng.randint(10, 9999)),
+        'size': rng.choice(sizes) if sizes and rng.random() < 0.9 else None,
+        'variant': rng.choice(variants) if rng.random() < 0.6 else None,
+    }
+
+
+def _label(rng, product):
+    """One noisy spelling of a product"""
+    _, type_spellings, _, _ = _TYPES[product['type']]
+    parts = [rng.choice(_BRANDS[product['brand']]), rng.choice(type_spellings)]
+    if rng.random() < 0.85:
+        parts.append(product['model'] if rng.random() < 0.8 else product['model'].lower())
+    if product['size'] is not None:
+        number, unit = product['size']
+        parts.append(number + rng.choice(_UNIT_SPELLINGS[unit]))
+    if product['variant'] is not None:
+        variant = product['variant']
+        parts.append(rng.choice((variant.title(), variant, variant.upper())))
+    if rng.random() < 0.25:
+        parts.insert(rng.randrange(1, len(parts) + 1), rng.choice(_FILLERS))
+    if rng.random() < 0.15:
+        # Size or variant first, as some tills print them
+        parts.insert(0, parts.pop())
+
+    label = ' '.join(part for part in parts if part)
+    noise = rng.random()
+    if noise < 0.1:
+        label = label.lower()
+    elif noise < 0.15:
+        label = label.upper()
+    elif noise < 0.25:
+        label = label.replace(' ', '-', 1)
+    elif noise < 0.3:
+        label = label + rng.choice((' ', '.', ' *'))
+    return label
+
+
+def synthetic_products(count, seed=0, spellings=4):
+    """``(labels, product_ids)``: ``count`` distinct noisy labels and the product each one spells
+
+    Each product gets between 1 and ``2 * spellings - 1`` spellings, so
+    about ``count / spellings`` products are generated.
+    """
+    rng = random.Random(seed)
+    labels = {}
+    product_id = 0
+    while len(labels) < count:
+        product_id += 1
+        product = _product(rng)
+        for _ in range(rng.randint(1, 2 * spellings - 1)):
+            label = _label(rng, product)
+            if label not in labels:
+                labels[label] = product_id
+            if len(labels) == count:
+                break
+    return list(labels), list(labels.values())
+
+
+def synthetic_catalog(count, seed=0):
+    """``count`` distinct noisy product labels"""
+    return synthetic_products(count, seed)[0]
+
+
+def synthetic_frames(labels, rows_per_label=5, seed=0):
+    """Sales and inventory frames over ``labels``, about ``rows_per_label`` rows per label each"""
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(labels, dtype=object)
+    rows = len(labels) * rows_per_label
+    sales_df = pd.DataFrame({
+        'Product': labels[rng.integers(0, len(labels), rows)],
+        'Sales (£)': rng.integers(1, 1000, rows),
+    })
+    inventory_df = pd.DataFrame({
+        'Product': labels[rng.integers(0, len(labels), rows)],
+        'Inventory Units': rng.integers(0, 100, rows),
+    })
+    return sales_df, inventory_df
+
+
+def _peak_rss():
+    """Peak resident memory of this process in bytes, or None where it is not available"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _Stages:
+    """Collects wall time, CPU time and (when tracing) peak allocations per stage"""
+
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.results = {}
+
+    def run(self, name, function, *args):
+        if self.trace_memory:
+            tracemalloc.start()
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            value = function(*args)
+        finally:
+            stage = {
+                'seconds': time.perf_counter() - start_wall,
+                'cpu_seconds': time.process_time() - start_cpu,
+            }
+            if self.trace_memory:
+                stage['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        self.results[name] = stage
+        return value
+
+
+def _apply(function, labels):
+    return [function(label) for label in labels]
+
+
+def _extract_features(labels):
+    features = FeatureCache()
+    for label in labels:
+        features[label]
+    return features
+
+
+def _standardize(groups, features):
+    mapping = {}
+    for group in groups:
+        profile = GroupProfile(group, features)
+        for name in group:
+            mapping[name] = standardize_product_name(name, group, features, profile)
+    return mapping
+
+
+def _score(mapping, features, config):
+    return {name: score_confidence(features[name], features[std_name], config)
+            for name, std_name in mapping.items()}
+
+
+def _pair_quality(groups, truth):
+    """Pair precision and recall of ``groups`` against ``truth`` (label -> product id)"""
+    predicted_pairs = sum(len(group) * (len(group) - 1) // 2 for group in groups)
+    true_sizes = {}
+    for product_id in truth.values():
+        true_sizes[product_id] = true_sizes.get(product_id, 0) + 1
+    true_pairs = sum(size * (size - 1) // 2 for size in true_sizes.values())
+
+    correct_pairs = 0
+    for group in groups:
+        counts = {}
+        for name in group:
+            counts[truth[name]] = counts.get(truth[name], 0) + 1
+        correct_pairs += sum(size * (size - 1) // 2 for size in counts.values())
+
+    return {
+        'pair_precision': correct_pairs / predicted_pairs if predicted_pairs else 1.0,
+        'pair_recall': correct_pairs / true_pairs if true_pairs else 1.0,
+    }
+
+
+def benchmark_size(count, config=None, seed=0, rows_per_label=5, trace_memory=False):
+    """Time every stage on one synthetic catalog of ``count`` labels"""
+    config = config or DEFAULT_CONFIG
+    labels, product_ids = synthetic_products(count, seed)
+    sales_df, inventory_df = synthetic_frames(labels, rows_per_label, seed)
+    stages = _Stages(trace_memory)
+
+    # Each extractor on its own, as the app called them before features were cached
+    for extractor in (extract_tokens, extract_size_info, extract_size_unit, extract_variant_tokens,
+                      extract_variant_info, extract_brand):
+        stages.run(extractor.__name__, _apply, extractor, labels)
+
+    features = stages.run('features', _extract_features, labels)
+    run_profile = RunProfile()
+    groups = stages.run('group_similar_products', group_similar_products, labels, config, features, None,
+                        run_profile)
+    mapping = stages.run('standardize_product_name', _standardize, groups, features)
+    stages.run('score_confidence', _score, mapping, features, config)
+    matched_df = stages.run('process_files_aggregation', _matched_frame, sales_df, inventory_df, mapping)
+
+    result = {
+        'labels': count,
+        'rows': len(sales_df) + len(inventory_df),
+        'groups': len(groups),
+        'largest_group': max((len(group) for group in groups), default=0),
+        'standardized_names': len(matched_df),
+        'stages': stages.results,
+        'counters': dict(run_profile.counters),
+        'total_seconds': sum(stage['seconds'] for stage in stages.results.values()),
+        'peak_rss_bytes': _peak_rss(),
+    }
+    result.update(_pair_quality(groups, dict(zip(labels, product_ids))))
+    return result
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, config=None, seed=0, rows_per_label=5, trace_memory=False,
+                  progress=None):
+    """Benchmark every catalog size and return the results as a JSON-serialisable dict
+
+    Sizes run smallest first, so ``peak_rss_bytes`` (a high-water mark of
+    the whole process) belongs to the largest catalog so far. With
+    ``trace_memory`` each stage also reports its peak Python allocations,
+    at the cost of slower timings; runs are only comparable with the same
+    setting. ``progress`` is an optional ``callable(message)``.
+    """
+    config = config or DEFAULT_CONFIG
+    results = []
+    for count in sorted(sizes):
+        if progress is not None:
+            progress(f"Benchmarking {count:,} labels...")
+        results.append(benchmark_size(count, config, seed, rows_per_label, trace_memory))
+
+    return {
+        'format': FORMAT_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'rule_version': RULE_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'versions': {'numpy': np.__version__, 'pandas': pd.__version__},
+        'config': dataclasses.asdict(config),
+        'seed': seed,
+        'rows_per_label': rows_per_label,
+        'trace_memory': trace_memory,
+        'results': results,
+    }
+
+
+def compare(baseline, current, tolerance=0.2, min_seconds=0.05):
+    """Stages of ``current`` that regressed against ``baseline``
+
+    A stage regresses when it takes more than ``1 + tolerance`` times the
+    baseline and at least ``min_seconds`` longer, or (when both runs traced
+    memory) allocates more than ``1 + tolerance`` times as much. Only sizes
+    present in both runs are compared. Returns a list of dicts with
+    ``labels``, ``stage``, ``metric``, ``baseline`` and ``current``.
+    """
+    if baseline.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported benchmark format {baseline.get('format')!r}")
+    if baseline.get('trace_memory') != current.get('trace_memory'):
+        raise ValueError("Runs with and without memory tracing are not comparable")
+
+    previous = {result['labels']: result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        old = previous.get(result['labels'])
+        if old is None:
+            continue
+        for stage, timings in result['stages'].items():
+            old_timings = old['stages'].get(stage)
+            if old_timings is None:
+                continue
+            checks = [('seconds', min_seconds)]
+            if 'peak_bytes' in timings and 'peak_bytes' in old_timings:
+                checks.append(('peak_bytes', 0))
+            for metric, slack in checks:
+                before = old_timings[metric]
+                after = timings[metric]
+                if after > before * (1 + tolerance) and after - before >= slack:
+                    regressions.append({'labels': result['labels'], 'stage': stage, 'metric': metric,
+                                        'baseline': before, 'current': after})
+    return regressions
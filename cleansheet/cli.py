@@ -0,0 +1,251 @@
+"""Command-line entry point for scheduled, headless runs.
+
+Usage::
+
+    python -m cleansheet match sales.csv inventory.csv \\
+        --label-col "Product Name" --label-col Item \\
+        --metric-col "Sales Value" --metric-col Stock \\
+        --min-similarity 0.7 -o outdir
+
+    python -m cleansheet bench --sizes 1000 100000 -o bench.json --baseline old.json
+
+Two or more CSV, Parquet or Arrow IPC files can be reconciled in one run.
+A ``--label-col`` or ``--metric-col`` given once applies to every file;
+otherwise give one per file, in file order. The Clean View and Matching
+Map (CSV or Parquet) are written under the same names as the app's
+download buttons, together with a JSON run summary (including the
+per-stage run profile) that is also printed to stdout. ``bench`` times
+the matching stages on synthetic catalogs (see :mod:`cleansheet.benchmark`).
+"""
+
+import argparse
+import dataclasses
+import json
+import os
+import sys
+import time
+
+from .benchmark import DEFAULT_SIZES, compare, run_benchmark
+from .config import CLUSTERINGS, DEFAULT_CONFIG, PAIR_ENGINES, MatchConfig
+from .formats import read_columns, write_table
+from .pipeline import DEFAULT_CHUNKSIZE, Source, output_columns, reconcile
+from .profiling import RunProfile
+
+# Exit codes; bad usage exits with 2 through argparse
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_BAD_INPUT = 3
+EXIT_REGRESSION = 4
+
+SUMMARY_FILE = 'cleansheet_run_summary.json'
+BENCHMARK_FILE = 'cleansheet_benchmark.json'
+
+# Metric columns preselected by the app for two files
+_DEFAULT_METRIC_COLS = ('Sales (£)', 'Inventory Units')
+
+
+def _per_file(values, count, default, option):
+    """One column name per file from a repeatable option"""
+    if not values:
+        if default is None:
+            raise ValueError(f"{option} is required when matching {count} files")
+        return list(default)
+    if len(values) == 1:
+        return values * count
+    if len(values) != count:
+        raise ValueError(f"{option} must be given once or once per file ({count} files)")
+    return values
+
+
+def _check_columns(path, columns):
+    header = read_columns(path)
+    missing = [column for column in columns if column not in header]
+    if missing:
+        raise ValueError(f"{path}: missing column(s) {', '.join(map(repr, missing))}")
+
+
+def config_from_args(args):
+    """Build the :class:`MatchConfig` for parsed command-line options"""
+    return MatchConfig(
+        min_similarity=args.min_similarity,
+        variant_protection=args.variant_protection,
+        size_protection=args.size_protection,
+        manual_review_threshold=args.review_threshold,
+        pair_engine=args.pair_engine,
+        clustering=args.clustering,
+        workers=args.workers
+    )
+
+
+def run_match(args, config):
+    """Run one reconciliation and return the run summary"""
+    start = time.time()
+    label_cols = _per_file(args.label_col, len(args.files), ['Product'] * len(args.files), '--label-col')
+    metric_cols = _per_file(args.metric_col, len(args.files),
+                            _DEFAULT_METRIC_COLS if len(args.files) == 2 else None, '--metric-col')
+
+    sources = [Source(path, label_col, (metric_col,))
+               for path, label_col, metric_col in zip(args.files, label_cols, metric_cols)]
+    for source in sources:
+        _check_columns(source.data, (source.label_col, *source.metric_cols))
+
+    def report_progress(percent, message):
+        if not args.quiet:
+            print(f"[{percent:3d}%] {message}", file=sys.stderr)
+
+    run_profile = RunProfile()
+    store = None
+    if args.store:
+        from .store import MatchStore
+
+        store = MatchStore(args.store)
+    try:
+        matched_df, summary_df = reconcile(sources, config, progress=report_progress, store=store,
+                                           chunksize=args.chunksize, run_profile=run_profile)
+    finally:
+        if store is not None:
+            store.close()
+
+    # Same file names as the app's download buttons
+    os.makedirs(args.output_dir, exist_ok=True)
+    extension = args.output_format
+    matched_path = os.path.join(args.output_dir, f"cleansheet_matched_{'_'.join(metric_cols)}.{extension}")
+    summary_path = os.path.join(args.output_dir, f"cleansheet_matching_map_{'_'.join(label_cols)}.{extension}")
+    with run_profile.stage('writing'):
+        write_table(matched_df, matched_path, args.output_format)
+        write_table(summary_df, summary_path, args.output_format)
+
+    return {
+        'status': 'ok',
+        'inputs': [
+            {'path': source.data, 'label_col': source.label_col, 'metric_col': source.metric_cols[0],
+             'output_col': columns[0]}
+            for source, columns in zip(sources, output_columns(sources))
+        ],
+        'outputs': {'clean_view': matched_path, 'matching_map': summary_path},
+        'labels': len(summary_df),
+        'standardized_names': len(matched_df),
+        'flagged': int((summary_df['Flag'] != "").sum()),
+        'average_confidence': float(summary_df['Confidence'].mean()) if len(summary_df) else None,
+        'config': dataclasses.asdict(config),
+        'seconds': time.time() - start,
+        'profile': run_profile.to_dict(),
+    }
+
+
+def run_bench(args, config):
+    """Run the benchmark, write its JSON and compare it with ``--baseline``; returns the exit code"""
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as handle:
+            baseline = json.load(handle)
+        if baseline.get('trace_memory') != args.trace_memory:
+            raise ValueError("Baseline was run with a different --trace-memory setting")
+
+    def report_progress(message):
+        if not args.quiet:
+            print(message, file=sys.stderr)
+
+    results = run_benchmark(args.sizes, config, seed=args.seed, rows_per_label=args.rows_per_label,
+                            trace_memory=args.trace_memory, progress=report_progress)
+    with open(args.output, 'w', encoding='utf-8') as handle:
+        json.dump(results, handle, indent=2)
+
+    for result in results['results']:
+        stages = ', '.join(f"{stage} {timing['seconds']:.2f}s" for stage, timing in result['stages'].items())
+        print(f"{result['labels']:,} labels: {result['total_seconds']:.2f}s ({stages})")
+
+    if baseline is None:
+        return EXIT_OK
+    regressions = compare(baseline, results, tolerance=args.tolerance)
+    for regression in regressions:
+        print(f"Regression at {regression['labels']:,} labels: {regression['stage']} {regression['metric']} "
+              f"{regression['baseline']:.4g} -> {regression['current']:.4g}", file=sys.stderr)
+    return EXIT_REGRESSION if regressions else EXIT_OK
+
+
+def _add_common_options(parser):
+    parser.add_argument('--min-similarity', type=float, default=DEFAULT_CONFIG.min_similarity)
+    parser.add_argument('--review-threshold', type=float, default=DEFAULT_CONFIG.manual_review_threshold,
+                        help='confidence below which labels are flagged for manual review')
+    parser.add_argument('--no-variant-protection', dest='variant_protection', action='store_false')
+    parser.add_argument('--no-size-protection', dest='size_protection', action='store_false')
+    parser.add_argument('--pair-engine', choices=PAIR_ENGINES, default=DEFAULT_CONFIG.pair_engine)
+    parser.add_argument('--clustering', choices=CLUSTERINGS, default=DEFAULT_CONFIG.clustering)
+    parser.add_argument('--workers', type=int, default=DEFAULT_CONFIG.workers)
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not print progress to stderr')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m cleansheet',
+                                     description='CleanSheet Matching Engine command line.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    match = commands.add_parser('match', help='match the labels of several files and aggregate their metrics')
+    match.add_argument('files', nargs='+', metavar='file',
+                       help='two or more CSV, Parquet or Arrow IPC files (format taken from the extension)')
+    match.add_argument('--label-col', action='append',
+                       help='label column; give once for all files or once per file. Default: Product')
+    match.add_argument('--metric-col', action='append',
+                       help='metric column; give once for all files or once per file. '
+                            'Default for two files: "Sales (£)" and "Inventory Units"')
+    match.add_argument('-o', '--output-dir', default='.', help='directory for the output files')
+    match.add_argument('--output-format', choices=['csv', 'parquet'], default='csv')
+    _add_common_options(match)
+    match.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help='rows read at a time')
+    match.add_argument('--store', help='SQLite match store reused across runs')
+
+    bench = commands.add_parser('bench', help='time the matching stages on synthetic catalogs')
+    bench.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                       help='catalog sizes in labels, e.g. 1000 10000 100000 1000000')
+    bench.add_argument('-o', '--output', default=BENCHMARK_FILE, help='JSON file for the results')
+    bench.add_argument('--baseline', help='earlier results to compare with; regressions exit with 4')
+    bench.add_argument('--tolerance', type=float, default=0.2,
+                       help='allowed slowdown or memory growth before a stage counts as a regression')
+    bench.add_argument('--seed', type=int, default=0)
+    bench.add_argument('--rows-per-label', type=int, default=5, help='rows per label in each generated file')
+    bench.add_argument('--trace-memory', action='store_true',
+                       help='record peak allocations per stage (slower; compare only with traced runs)')
+    _add_common_options(bench)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'match' and len(args.files) < 2:
+        parser.error("match needs at least two files")
+    try:
+        config = config_from_args(args)
+    except ValueError as error:
+        parser.error(str(error))
+
+    if args.command == 'bench':
+        try:
+            return run_bench(args, config)
+        except (OSError, ValueError) as error:
+            print(f"cleansheet: {error}", file=sys.stderr)
+            return EXIT_BAD_INPUT
+
+    try:
+        summary = run_match(args, config)
+        code = EXIT_OK
+    except (OSError, ValueError) as error:
+        summary = {'status': 'error', 'error': str(error)}
+        code = EXIT_BAD_INPUT
+    except Exception as error:
+        summary = {'status': 'error', 'error': f"{type(error).__name__}: {error}"}
+        code = EXIT_FAILED
+    summary['exit_code'] = code
+
+    if code == EXIT_OK:
+        with open(os.path.join(args.output_dir, SUMMARY_FILE), 'w', encoding='utf-8') as handle:
+            json.dump(summary, handle, indent=2)
+    else:
+        print(f"cleansheet: {summary['error']}", file=sys.stderr)
+    print(json.dumps(summary, indent=2))
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
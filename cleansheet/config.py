@@ -0,0 +1,59 @@
+"""Matching settings shared by the engine, the pipeline and the UI."""
+
+from dataclasses import dataclass
+from typing import Optional
+
+# How candidate pairs are found and scored inside each variant bucket:
+# "index" uses the prefix-filtered inverted token index, "sparse" scores
+# blocks of rows with scipy sparse matrix products, "minhash" finds
+# approximate candidates with MinHash LSH before exact verification and
+# "tfidf" scores TF-IDF character n-gram cosine instead of token Jaccard,
+# keeping each name's top-k neighbours.
+PAIR_ENGINES = ('index', 'sparse', 'minhash', 'tfidf')
+
+# How scored pairs become groups: "greedy" grows a group around each seed in
+# input order, "union_find" merges the thresholded edge list and gives the
+# same groups for any input order.
+CLUSTERINGS = ('greedy', 'union_find')
+
+
+@dataclass(frozen=True)
+class MatchConfig:
+    """Settings that control how labels are grouped and scored.
+
+    These used to be read from the Streamlit sidebar globals; passing them
+    explicitly lets the engine run without a Streamlit script context.
+    """
+
+    min_similarity: float = 0.7
+    variant_protection: bool = True
+    size_protection: bool = True
+    manual_review_threshold: float = 0.5
+    pair_engine: str = 'index'
+    block_size: int = 2048
+    # None derives the LSH band layout from min_similarity (see lsh.band_layout)
+    lsh_bands: Optional[int] = None
+    lsh_rows: Optional[int] = None
+    tfidf_ngram: int = 3
+    tfidf_top_k: int = 20
+    clustering: str = 'greedy'
+    workers: int = 1
+
+    def __post_init__(self):
+        for field_name in ('min_similarity', 'manual_review_threshold'):
+            value = getattr(self, field_name)
+            if not 0.0 <= value <= 1.0:
+                raise ValueError(f"{field_name} must be between 0 and 1, got {value!r}")
+        if self.pair_engine not in PAIR_ENGINES:
+            raise ValueError(f"pair_engine must be one of {PAIR_ENGINES}, got {self.pair_engine!r}")
+        if self.clustering not in CLUSTERINGS:
+            raise ValueError(f"clustering must be one of {CLUSTERINGS}, got {self.clustering!r}")
+        if (self.lsh_bands is None) != (self.lsh_rows is None):
+            raise ValueError("lsh_bands and lsh_rows must be given together")
+        for field_name in ('block_size', 'lsh_bands', 'lsh_rows', 'tfidf_ngram', 'tfidf_top_k', 'workers'):
+            value = getattr(self, field_name)
+            if value is not None and value < 1:
+                raise ValueError(f"{field_name} must be positive, got {value!r}")
+
+
+DEFAULT_CONFIG = MatchConfig()
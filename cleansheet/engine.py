@@ -0,0 +1,1147 @@
+"""Headless matching engine.
+
+The functions here were lifted out of the Streamlit app so they can be
+imported by batch jobs without UI side effects. Settings are passed in as
+a :class:`~cleansheet.config.MatchConfig` instead of being read from
+sidebar globals.
+"""
+
+import math
+import os
+import re
+from collections import Counter
+
+from .config import DEFAULT_CONFIG
+from .profiling import RunProfile
+from .stopwords import ENGLISH_STOP_WORDS, load_stop_words
+
+# Bump whenever a change to extraction, grouping or naming rules can change
+# results, so persisted matches from older rules are not reused
+RULE_VERSION = 1
+
+_stop_words = None
+
+# Regular expression passes made by preprocess_text and scan_measurements
+_regex_calls = 0
+
+
+def get_stop_words():
+    """Return the active stopword set
+
+    The built-in English list is used unless ``CLEANSHEET_STOPWORDS`` names
+    a stopword file or :func:`set_stop_words` was called.
+    """
+    global _stop_words
+    if _stop_words is None:
+        path = os.environ.get('CLEANSHEET_STOPWORDS')
+        _stop_words = load_stop_words(path) if path else ENGLISH_STOP_WORDS
+    return _stop_words
+
+
+def set_stop_words(words):
+    """Replace the stopword set used by :func:`extract_tokens`
+
+    Pass ``None`` to go back to the default (built-in list or
+    ``CLEANSHEET_STOPWORDS``). Feature caches built before the change keep
+    their old tokens.
+    """
+    global _stop_words
+    _stop_words = frozenset(words) if words is not None else None
+
+
+def regex_call_count():
+    """Regular expression passes made by text preprocessing and size scanning so far"""
+    return _regex_calls
+
+
+def preprocess_text(text):
+    """Clean and normalize text for better matching"""
+    global _regex_calls
+    if not isinstance(text, str):
+        return ""
+    _regex_calls += 2
+
+    # Convert to lowercase
+    text = text.lower()
+
+    # Replace special characters with spaces
+    text = re.sub(r'[^\w\s]', ' ', text)
+
+    # Replace underscores with spaces
+    text = text.replace('_', ' ')
+
+    # Normalize spaces
+    text = re.sub(r'\s+', ' ', text).strip()
+
+    return text
+
+
+def extract_tokens(product_name):
+    """Extract meaningful tokens from product name"""
+    if not isinstance(product_name, str):
+        return []
+
+    # Preprocess the text
+    text = preprocess_text(product_name)
+
+    # Simple tokenization by splitting on spaces
+    tokens = text.split()
+
+    # Remove stopwords
+    stop_words = _stop_words if _stop_words is not None else get_stop_words()
+    tokens = [token for token in tokens if token not in stop_words]
+
+    return tokens
+
+
+# One alternation finds every number and, when present, the unit right
+# after it. "l" and "g" must end a word; a directly following digit is
+# accepted here but only counts in the letter/digit-split form of the name
+# (e.g. "2l3" -> "2l 3"), which the old per-pattern searches also scanned.
+_MEASUREMENT_RE = re.compile(r'(\d+)(?:(\s*)(inch|in|ml|oz|gb|tb|kg|l(?![^\W\d])|g(?![^\W\d])))?')
+
+# Standalone numbers that are likely to be sizes (e.g., 13, 32, 40, 50)
+SIZE_NUMBERS = frozenset(['13', '32', '40', '50', '55', '65', '75'])
+
+# Unit family -> (priority when picking the size, canonical unit)
+_UNIT_FAMILIES = {
+    'in': (0, 'in'), 'inch': (0, 'in'), 'ml': (1, 'ml'), 'l': (2, 'L'), 'oz': (3, 'oz'),
+    'gb': (4, 'GB'), 'tb': (5, 'TB'), 'kg': (6, 'kg'), 'g': (7, 'g'),
+}
+
+# Order in which variant tokens were historically listed (by pattern)
+_VARIANT_TOKEN_ORDER = {
+    'ml': 0, 'l': 1, 'oz': 2, 'kg': 3, 'g': 4, 'in': 5, 'inch': 6, 'gb': 7, 'tb': 8,
+}
+
+
+class MeasurementScan:
+    """Result of one pass of the measurement scanner over a product name
+
+    ``occurrences`` holds ``(position, number, spacing, unit, exact)`` for
+    every number followed by a unit. ``exact`` is false for matches that
+    only exist once letters and digits are split apart. ``standalone`` and
+    ``split_standalone`` are the likely size numbers that are whole tokens
+    of the name, before and after that split.
+    """
+
+    __slots__ = ('occurrences', 'standalone', 'split_standalone', 'size', 'unit')
+
+    def __init__(self, occurrences, standalone, split_standalone):
+        self.occurrences = occurrences
+        self.standalone = standalone
+        self.split_standalone = split_standalone
+
+        # Exact matches win; split-only matches are a fallback. Within a
+        # stage the unit priority decides, then the leftmost match.
+        best = None
+        for exact_only in (True, False):
+            for position, number, _, unit, exact in occurrences:
+                if exact_only and not exact:
+                    continue
+                key = (_UNIT_FAMILIES[unit][0], position)
+                if best is None or key < best[0]:
+                    best = (key, number, _UNIT_FAMILIES[unit][1])
+            if best is not None:
+                break
+
+        if best is not None:
+            self.size = best[1]
+            self.unit = best[2]
+        else:
+            self.size = standalone[0] if standalone else None
+            self.unit = None
+
+    def variant_tokens(self):
+        """Size, volume and weight tokens, e.g. ``['500ml', '32']``"""
+        ordered = []
+        for position, number, spacing, unit, exact in self.occurrences:
+            stage = 0 if exact else 1
+            if unit == 'inch':
+                # "32inch" is listed both as "32in" and "32inch"
+                ordered.append((stage, _VARIANT_TOKEN_ORDER['in'], position, number + spacing + 'in'))
+            ordered.append((stage, _VARIANT_TOKEN_ORDER[unit], position, number + spacing + unit))
+        ordered.sort()
+
+        # Remove duplicates while preserving order
+        tokens = [token for _, _, _, token in ordered]
+        tokens.extend(self.standalone)
+        tokens.extend(self.split_standalone)
+        return list(dict.fromkeys(tokens))
+
+
+def scan_measurements(product_name):
+    """Scan a product name once for sizes, units and standalone size numbers"""
+    global _regex_calls
+    _regex_calls += 1
+    text = product_name.lower()
+    length = len(text)
+    occurrences = []
+    standalone = []
+    split_standalone = []
+
+    for match in _MEASUREMENT_RE.finditer(text):
+        start, digits_end = match.span(1)
+        number = match.group(1)
+        unit = match.group(3)
+
+        if unit is not None:
+            end = match.end()
+            exact = not (unit in ('l', 'g') and end < length and text[end].isdigit())
+            occurrences.append((start, number, match.group(2), unit, exact))
+
+        if number in SIZE_NUMBERS and (digits_end == length or text[digits_end].isspace()):
+            before = text[start - 1] if start else ' '
+            if before.isspace():
+                standalone.append(number)
+            elif before.isascii() and before.isalpha():
+                # A token only once letters and digits are split ("iphone13")
+                split_standalone.append(number)
+
+    return MeasurementScan(occurrences, standalone, split_standalone)
+
+
+def extract_size_info(product_name):
+    """Extract size information from product name"""
+    if not isinstance(product_name, str):
+        return None
+    return scan_measurements(product_name).size
+
+
+def extract_size_unit(product_name):
+    """Extract size unit from product name"""
+    if not isinstance(product_name, str):
+        return None
+    return scan_measurements(product_name).unit
+
+
+def extract_variant_tokens(product_name):
+    """Extract all variant tokens (size, volume, weight) that should be treated as hard split conditions"""
+    if not isinstance(product_name, str):
+        return []
+    return scan_measurements(product_name).variant_tokens()
+
+
+def extract_brand(product_name):
+    """Extract potential brand name from product name"""
+    if not isinstance(product_name, str):
+        return None
+
+    # Common brand names to look for
+    common_brands = [
+        'samsung', 'apple', 'sony', 'lg', 'coca-cola', 'coke', 'pepsi',
+        'microsoft', 'dell', 'hp', 'lenovo', 'asus', 'acer', 'toshiba'
+    ]
+
+    tokens = extract_tokens(product_name)
+
+    # Check if any token matches a common brand
+    for token in tokens:
+        if token.lower() in common_brands:
+            return token
+
+    # If no match, assume first token might be brand
+    if tokens:
+        return tokens[0]
+
+    return None
+
+
+def extract_variant_info(product_name):
+    """Extract variant information from product name"""
+    if not isinstance(product_name, str):
+        return []
+
+    # Common variant keywords
+    variant_keywords = [
+        'pro', 'mini', 'max', 'plus', 'basic', 'smart', 'vanilla', 'zero',
+        'premium', 'standard', 'lite', 'ultra', 'gold', 'silver', 'black', 'white'
+    ]
+
+    tokens = extract_tokens(product_name.lower())
+    variants = [token for token in tokens if token in variant_keywords]
+
+    return variants
+
+
+class ProductFeatures:
+    """Features of one product name, extracted once and reused by every stage"""
+
+    __slots__ = ('name', 'lower', 'tokens', 'token_set', 'size', 'unit',
+                 'variants', 'variant_set', 'variant_tokens', 'variant_token_set',
+                 'variant_key', 'brand')
+
+    def __init__(self, name):
+        self.name = name
+        self.lower = name.lower() if isinstance(name, str) else ''
+        self.tokens = extract_tokens(name)
+        scan = scan_measurements(name) if isinstance(name, str) else None
+        self.size = scan.size if scan else None
+        self.unit = scan.unit if scan else None
+        self.variants = extract_variant_info(name)
+        self.variant_tokens = scan.variant_tokens() if scan else []
+        self.brand = extract_brand(name)
+        self._derive()
+
+    def _derive(self):
+        self.token_set = frozenset(self.tokens)
+        self.variant_set = frozenset(self.variants)
+        self.variant_token_set = frozenset(self.variant_tokens)
+        # Bucket key used to split names with different sizes before matching
+        self.variant_key = tuple(sorted(self.variant_tokens)) if self.variant_tokens else ('no_variants',)
+
+    def to_record(self):
+        """Plain, JSON-serialisable form of the extracted features"""
+        return {
+            'tokens': self.tokens,
+            'size': self.size,
+            'unit': self.unit,
+            'variants': self.variants,
+            'variant_tokens': self.variant_tokens,
+            'brand': self.brand,
+        }
+
+    @classmethod
+    def from_record(cls, name, record):
+        """Rebuild features saved with :meth:`to_record` without re-extracting them"""
+        features = cls.__new__(cls)
+        features.name = name
+        features.lower = name.lower() if isinstance(name, str) else ''
+        features.tokens = list(record['tokens'])
+        features.size = record['size']
+        features.unit = record['unit']
+        features.variants = list(record['variants'])
+        features.variant_tokens = list(record['variant_tokens'])
+        features.brand = record['brand']
+        features._derive()
+        return features
+
+    def __repr__(self):
+        return f"ProductFeatures({self.name!r})"
+
+
+class FeatureCache(dict):
+    """Mapping from product name to its :class:`ProductFeatures`, filled on first access"""
+
+    def __missing__(self, name):
+        features = self[name] = ProductFeatures(name)
+        return features
+
+
+def features_similarity(features1, features2):
+    """Jaccard similarity between the token sets of two feature records"""
+    return jaccard(features1.token_set, features2.token_set)
+
+
+def jaccard(tokens1, tokens2):
+    """Jaccard similarity of two token sets"""
+    if not tokens1 or not tokens2:
+        return 0.0
+
+    intersection = len(tokens1 & tokens2)
+    union = len(tokens1) + len(tokens2) - intersection
+
+    return intersection / union if union > 0 else 0.0
+
+
+def features_variant_conflict(features1, features2, config=None):
+    """Variant conflict check on precomputed features"""
+    config = config or DEFAULT_CONFIG
+    if not config.variant_protection:
+        return False
+
+    # If both have variants but they don't match, it's a conflict
+    variants1 = features1.variant_set
+    variants2 = features2.variant_set
+    return bool(variants1 and variants2 and variants1.isdisjoint(variants2))
+
+
+def features_size_conflict(features1, features2, config=None):
+    """Size conflict check on precomputed features"""
+    config = config or DEFAULT_CONFIG
+    if not config.size_protection:
+        return False
+
+    # First check using the traditional size extraction
+    size1 = features1.size
+    size2 = features2.size
+    if size1 and size2 and size1 != size2:
+        return True
+
+    # If both have variant tokens but they don't share any, it's a conflict
+    variant_tokens1 = features1.variant_token_set
+    variant_tokens2 = features2.variant_token_set
+    return bool(variant_tokens1 and variant_tokens2 and variant_tokens1.isdisjoint(variant_tokens2))
+
+
+def calculate_token_similarity(name1, name2):
+    """Calculate similarity based on shared tokens"""
+    tokens1 = set(extract_tokens(name1))
+    tokens2 = set(extract_tokens(name2))
+
+    if not tokens1 or not tokens2:
+        return 0.0
+
+    # Calculate Jaccard similarity
+    intersection = len(tokens1.intersection(tokens2))
+    union = len(tokens1.union(tokens2))
+
+    return intersection / union if union > 0 else 0.0
+
+
+def check_variant_conflict(name1, name2, config=None):
+    """Check if there's a variant conflict between two product names"""
+    config = config or DEFAULT_CONFIG
+    if not config.variant_protection:
+        return False
+    return features_variant_conflict(ProductFeatures(name1), ProductFeatures(name2), config)
+
+
+def check_size_conflict(name1, name2, config=None):
+    """Check if there's a size conflict between two product names"""
+    config = config or DEFAULT_CONFIG
+    if not config.size_protection:
+        return False
+    return features_size_conflict(ProductFeatures(name1), ProductFeatures(name2), config)
+
+
+class GroupProfile:
+    """Counts and lookups for one product group, built once and shared by its members"""
+
+    # Variant keywords whose presence in a similar group member carries over
+    KEYWORDS = ('smart', 'basic', 'pro', 'mini', 'vanilla', 'zero')
+
+    __slots__ = ('size', 'all_tokens', 'all_variants', 'joined_tokens', 'token_counts',
+                 'variant_counts', 'size_counts', 'size_unit_counts', 'brand_counts',
+                 'is_tv', 'is_iphone', 'is_cola', 'has_ml', 'has_l', 'first_digit',
+                 'frequent_tokens', 'keyword_token_sets', '_keyword_matches')
+
+    def __init__(self, product_group, features):
+        self.size = len(product_group)
+
+        # Extract common tokens across the group
+        all_tokens = []
+        all_variants = []
+        all_sizes = []
+        all_size_units = []
+        all_brands = []
+        keyword_token_sets = {keyword: set() for keyword in self.KEYWORDS}
+
+        for name in product_group:
+            member = features[name]
+            all_tokens.extend(member.tokens)
+            all_variants.extend(member.variants)
+
+            if member.size:
+                all_sizes.append(member.size)
+
+            if member.unit:
+                all_size_units.append(member.unit)
+
+            if member.brand:
+                all_brands.append(member.brand)
+
+            # Members are only needed by keyword and token set for the similarity scans
+            for keyword in self.KEYWORDS:
+                if keyword in member.lower:
+                    keyword_token_sets[keyword].add(member.token_set)
+
+        self.all_tokens = all_tokens
+        self.all_variants = all_variants
+        self.joined_tokens = ' '.join(all_tokens).lower()
+
+        # Count token frequencies
+        self.token_counts = Counter(all_tokens)
+        self.variant_counts = Counter(all_variants)
+        self.size_counts = Counter(all_sizes)
+        self.size_unit_counts = Counter(all_size_units)
+        self.brand_counts = Counter(all_brands)
+
+        # Product type and fallbacks used by the naming rules
+        lowered = [token.lower() for token in all_tokens]
+        self.is_tv = any('tv' in token for token in lowered)
+        self.is_iphone = any('iphone' in token for token in lowered) or any('apple' in token for token in lowered)
+        self.is_cola = any('coca' in token for token in lowered) or any('cola' in token for token in lowered)
+        self.has_ml = any('ml' in token for token in lowered)
+        self.has_l = any('l' in token for token in lowered)
+        self.first_digit = next((token for token in all_tokens if token.isdigit()), None)
+        self.frequent_tokens = [token for token, count in self.token_counts.most_common()
+                                if count > self.size / 3]
+
+        self.keyword_token_sets = keyword_token_sets
+        self._keyword_matches = {}
+
+    def has_similar_member(self, keyword, product):
+        """Whether a member containing ``keyword`` has similarity > 0.7 with ``product``"""
+        key = (keyword, product.token_set)
+        found = self._keyword_matches.get(key)
+        if found is None:
+            found = any(jaccard(tokens, product.token_set) > 0.7
+                        for tokens in self.keyword_token_sets[keyword])
+            self._keyword_matches[key] = found
+        return found
+
+
+def standardize_product_name(product_name, product_group, features=None, profile=None):
+    """Generate a standardized name for a product based on its group
+
+    ``features`` is an optional :class:`FeatureCache` shared across calls so
+    each name is only analysed once, and ``profile`` an optional
+    :class:`GroupProfile` of ``product_group`` shared by all its members.
+    """
+    if not product_group:
+        return product_name
+
+    if features is None:
+        features = FeatureCache()
+    if profile is None:
+        profile = GroupProfile(product_group, features)
+    product = features[product_name]
+
+    variant_counts = profile.variant_counts
+
+    # For this specific product, use its own size/variant tokens
+    # instead of the most common ones from the group
+    product_size = product.size
+    product_size_unit = product.unit
+
+    # Get the most common size only if this product doesn't have one
+    common_size = product_size if product_size else (profile.size_counts.most_common(1)[0][0] if profile.size_counts else None)
+
+    # Get the most common size unit only if this product doesn't have one
+    common_size_unit = product_size_unit if product_size_unit else (profile.size_unit_counts.most_common(1)[0][0] if profile.size_unit_counts else None)
+
+    # Check if the specific product has a variant
+    product_variants = product.variants
+
+    # Build standardized name
+    std_name_parts = []
+
+    # Format based on product type
+    if profile.is_tv:
+        # Samsung TV format: "Samsung TV 32in Smart"
+        std_name_parts.append('Samsung')
+        std_name_parts.append('TV')
+
+        # Add size - use the product's own size if available
+        if product_size:
+            std_name_parts.append(f"{product_size}in")
+        elif common_size:
+            std_name_parts.append(f"{common_size}in")
+
+        # Add variant
+        if 'smart' in product.lower or profile.has_similar_member('smart', product):
+            std_name_parts.append('Smart')
+        elif 'basic' in product.lower or profile.has_similar_member('basic', product):
+            std_name_parts.append('Basic')
+        elif len(variant_counts) > 1 or not any(v for v in ['smart', 'basic'] if v in profile.joined_tokens):
+            std_name_parts.append('(Unspecified Variant)')
+
+    elif profile.is_iphone:
+        # iPhone format: "Apple iPhone 13 Pro"
+        std_name_parts.append('Apple')
+        std_name_parts.append('iPhone')
+
+        # Add model number - check in the specific product first,
+        # then fall back to the first one in the group
+        model = next((token for token in product.tokens if token.isdigit()), profile.first_digit)
+        if model:
+            std_name_parts.append(model)
+
+        # Add variant - prioritize the product's own variant
+        if 'pro' in product.lower:
+            std_name_parts.append('Pro')
+        elif 'mini' in product.lower:
+            std_name_parts.append('Mini')
+        elif profile.has_similar_member('pro', product):
+            std_name_parts.append('Pro')
+        elif profile.has_similar_member('mini', product):
+            std_name_parts.append('Mini')
+        elif len(variant_counts) > 1 or not any(v for v in ['pro', 'mini'] if v in profile.joined_tokens):
+            std_name_parts.append('(Unspecified Variant)')
+
+    elif profile.is_cola:
+        # Coca-Cola format: "Coca-Cola 330ml Vanilla"
+        std_name_parts.append('Coca-Cola')
+
+        # Add size - use the product's own size if available
+        if product_size and product_size_unit:
+            # Use the product's own size and unit
+            if product_size_unit.lower() == 'ml':
+                std_name_parts.append(f"{product_size}ml")
+            elif product_size_unit.lower() == 'l':
+                std_name_parts.append(f"{product_size}L")
+        elif common_size:
+            # Fallback to common size if product doesn't have one
+            if profile.has_ml:
+                std_name_parts.append(f"{common_size}ml")
+            elif profile.has_l:
+                std_name_parts.append(f"{common_size}L")
+
+        # Add variant
+        if 'vanilla' in product.lower or profile.has_similar_member('vanilla', product):
+            std_name_parts.append('Vanilla')
+        elif 'zero' in product.lower or profile.has_similar_member('zero', product):
+            std_name_parts.append('Zero')
+
+    else:
+        # Generic format - use the original approach
+        # Get the most common brand
+        common_brand = profile.brand_counts.most_common(1)[0][0] if profile.brand_counts else None
+
+        # Get the most common tokens (excluding brand, size, and variants)
+        exclude_tokens = set()
+        if common_brand:
+            exclude_tokens.add(common_brand.lower())
+        if common_size:
+            exclude_tokens.add(common_size.lower())
+        for variant in profile.all_variants:
+            exclude_tokens.add(variant.lower())
+
+        common_tokens = [token for token in profile.frequent_tokens if token.lower() not in exclude_tokens]
+
+        # Add brand if available
+        if common_brand:
+            std_name_parts.append(common_brand.title())
+
+        # Add common tokens
+        std_name_parts.extend([token.title() for token in common_tokens[:2]])
+
+        # Add size if available - use the product's own size if available
+        if product_size and product_size_unit:
+            std_name_parts.append(f"{product_size}{product_size_unit}")
+        elif product_size:
+            std_name_parts.append(f"{product_size}")
+        elif common_size and common_size_unit:
+            std_name_parts.append(f"{common_size}{common_size_unit}")
+        elif common_size:
+            std_name_parts.append(f"{common_size}")
+
+        # Add specific variant if available
+        if product_variants:
+            std_name_parts.append(product_variants[0].title())
+        elif variant_counts:
+            # If no specific variant but multiple variants exist in the group
+            if len(variant_counts) > 1:
+                std_name_parts.append("(Unspecified Variant)")
+            else:
+                # Add the most common variant
+                std_name_parts.append(variant_counts.most_common(1)[0][0].title())
+
+    # Join all parts
+    std_name = " ".join(std_name_parts)
+
+    # If we couldn't generate a good name, fallback to original
+    if not std_name or len(std_name_parts) < 2:
+        return product_name
+
+    return std_name
+
+
+def prefix_length(size, threshold):
+    """Number of leading (rarest) tokens that must be indexed for a Jaccard threshold
+
+    Two token sets with Jaccard >= ``threshold`` share at least
+    ``ceil(threshold * size)`` tokens, so under a common token order they
+    must share a token within their first ``size - ceil(threshold * size) + 1``
+    tokens. The small epsilon keeps float rounding on the safe side.
+    """
+    return max(1, min(size, size - math.ceil(threshold * size - 1e-9) + 1))
+
+
+class TokenIndex:
+    """Inverted index from token to positions, used to block candidate pairs
+
+    Only the prefix tokens of each set (rarest first) are indexed, and
+    candidates are also filtered by set size, so a lookup returns every
+    position whose Jaccard similarity could reach ``threshold``.
+    """
+
+    def __init__(self, token_sets, threshold):
+        self.threshold = threshold
+        self.sizes = [len(tokens) for tokens in token_sets]
+
+        # Order tokens by document frequency so prefixes hold the rare tokens
+        frequency = Counter()
+        for tokens in token_sets:
+            frequency.update(tokens)
+        self.rank = {token: rank for rank, (token, _) in
+                     enumerate(sorted(frequency.items(), key=lambda item: (item[1], item[0])))}
+
+        self.postings = {}
+        self.prefixes = []
+        for position, tokens in enumerate(token_sets):
+            prefix = self.prefix(tokens)
+            self.prefixes.append(prefix)
+            for token in prefix:
+                self.postings.setdefault(token, []).append(position)
+
+    def prefix(self, tokens):
+        """Return the indexed prefix of a token set"""
+        if not tokens:
+            return []
+        rank = self.rank
+        ordered = sorted(tokens, key=lambda token: (rank.get(token, -1), token))
+        return ordered[:prefix_length(len(ordered), self.threshold)]
+
+    def candidates(self, position):
+        """Sorted positions that may reach the threshold with ``position``"""
+        return self.probe(self.prefixes[position], self.sizes[position], exclude=position)
+
+    def probe(self, prefix, size, exclude=None):
+        """Sorted positions sharing a prefix token and passing the size filter"""
+        if not size:
+            return []
+        low = self.threshold * size - 1e-9
+        high = size / self.threshold + 1e-9
+        sizes = self.sizes
+        found = set()
+        for token in prefix:
+            found.update(self.postings.get(token, ()))
+        found.discard(exclude)
+        return sorted(j for j in found if low <= sizes[j] <= high)
+
+
+def _candidate_source(bucket, config):
+    """Return ``(candidates_for, prescored, similarity)`` for the names in one variant bucket
+
+    ``candidates_for(i)`` yields the positions that may reach
+    ``min_similarity`` with position ``i``; ``prescored`` is true when the
+    engine already verified the threshold. ``similarity(i, j)`` scores a
+    pair with the engine's measure: token Jaccard, or n-gram cosine for
+    ``'tfidf'``. With a zero threshold every pair qualifies, so blocking is
+    skipped and ``candidates_for`` is ``None``.
+    """
+    token_sets = [product.token_set for product in bucket]
+    if config.pair_engine == 'tfidf':
+        from .tfidf import NgramIndex
+
+        index = NgramIndex(token_sets, config.tfidf_ngram, config.block_size)
+        if config.min_similarity <= 0:
+            return None, False, index.similarity
+        # Neighbour lists already hold only pairs at or above the threshold
+        return (index.neighbour_lists(config.min_similarity, config.tfidf_top_k).__getitem__, True,
+                index.similarity)
+
+    def similarity(i, j):
+        return features_similarity(bucket[i], bucket[j])
+
+    if config.min_similarity <= 0:
+        return None, False, similarity
+    if config.pair_engine == 'sparse':
+        from .sparse import neighbour_lists
+
+        # Neighbour lists already hold only pairs at or above the threshold
+        return neighbour_lists(token_sets, config.min_similarity, config.block_size).__getitem__, True, similarity
+    if config.pair_engine == 'minhash':
+        from .lsh import neighbour_lists
+
+        # Approximate: only LSH collisions that pass exact Jaccard are kept
+        return neighbour_lists(token_sets, config.min_similarity,
+                               config.lsh_bands, config.lsh_rows).__getitem__, True, similarity
+    return TokenIndex(token_sets, config.min_similarity).candidates, False, similarity
+
+
+def _greedy_groups(bucket, config, counts=None):
+    """Seed-based grouping: each seed takes every unassigned similar name
+
+    ``counts`` is an optional :class:`~collections.Counter` that receives
+    the number of candidate pairs, scored pairs and variant conflicts.
+    """
+    candidates_for, prescored, similarity = _candidate_source(bucket, config)
+    groups = []
+    candidate_pairs = 0
+    variant_conflicts = 0
+
+    variant_assigned = set()
+    for i, features1 in enumerate(bucket):
+        if i in variant_assigned:
+            continue
+
+        current_group = [features1.name]
+        variant_assigned.add(i)
+
+        candidates = candidates_for(i) if candidates_for is not None else range(len(bucket))
+        for j in candidates:
+            if j in variant_assigned or i == j:
+                continue
+            features2 = bucket[j]
+            candidate_pairs += 1
+
+            # Check for conflicts (still check variant conflicts for other variant types)
+            if features_variant_conflict(features1, features2, config):
+                variant_conflicts += 1
+                continue
+
+            if prescored or similarity(i, j) >= config.min_similarity:
+                current_group.append(features2.name)
+                variant_assigned.add(j)
+
+        groups.append(current_group)
+
+    if counts is not None:
+        counts['candidate_pairs'] += candidate_pairs
+        counts['pairs_scored'] += 0 if prescored else candidate_pairs - variant_conflicts
+        counts['variant_conflicts'] += variant_conflicts
+    return groups
+
+
+def name_sort_key(name):
+    """Deterministic sort key for product names, including non-string labels"""
+    return (str(name), type(name).__name__)
+
+
+class UnionFind:
+    """Disjoint sets with path compression and union by size"""
+
+    def __init__(self, count):
+        self.parent = list(range(count))
+        self.size = [1] * count
+
+    def find(self, item):
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Path compression
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, first, second):
+        """Merge the sets of two roots and return the surviving root"""
+        if self.size[first] < self.size[second]:
+            first, second = second, first
+        self.parent[second] = first
+        self.size[first] += self.size[second]
+        return first
+
+
+def _union_find_groups(bucket, config, counts=None):
+    """Order-independent grouping: merge thresholded edges with cannot-link checks
+
+    Edges are processed strongest first (ties broken by name), and two
+    components are only merged when no pair across them has a variant or
+    size conflict. The result depends only on the set of names.
+    """
+    candidates_for, _, similarity = _candidate_source(bucket, config)
+
+    edges = []
+    pairs_scored = 0
+    for i in range(len(bucket)):
+        candidates = candidates_for(i) if candidates_for is not None else range(len(bucket))
+        for j in candidates:
+            if j <= i:
+                continue
+            pairs_scored += 1
+            score = similarity(i, j)
+            if score >= config.min_similarity:
+                edges.append((i, j, score))
+
+    if counts is not None:
+        counts['candidate_pairs'] += pairs_scored
+        counts['pairs_scored'] += pairs_scored
+    return _merge_edges(bucket, edges, config, counts)
+
+
+def _conflict_kind(features1, features2, config):
+    """``'variant_conflicts'``, ``'size_conflicts'`` or None for a pair that may not be merged"""
+    if features_variant_conflict(features1, features2, config):
+        return 'variant_conflicts'
+    if features_size_conflict(features1, features2, config):
+        return 'size_conflicts'
+    return None
+
+
+def _merge_edges(bucket, edges, config, counts=None):
+    """Union-find over scored ``(i, j, similarity)`` edges of one bucket
+
+    Merges refused because of a conflict are added to ``counts`` (an
+    optional :class:`~collections.Counter`) by kind.
+    """
+    keys = [name_sort_key(product.name) for product in bucket]
+    ordered = []
+    for i, j, similarity in edges:
+        first, second = (i, j) if keys[i] <= keys[j] else (j, i)
+        ordered.append((-similarity, keys[first], keys[second], i, j))
+    ordered.sort()
+
+    # Each component keeps one representative per distinct conflict signature,
+    # so cannot-link checks compare signatures rather than every member
+    sets = UnionFind(len(bucket))
+    signatures = [{(product.variant_set, product.size, product.variant_token_set): product}
+                  for product in bucket]
+
+    for _, _, _, i, j in ordered:
+        root1 = sets.find(i)
+        root2 = sets.find(j)
+        if root1 == root2:
+            continue
+        members1 = signatures[root1]
+        members2 = signatures[root2]
+        conflict = next((kind for a in members1.values() for b in members2.values()
+                         if (kind := _conflict_kind(a, b, config))), None)
+        if conflict is not None:
+            if counts is not None:
+                counts[conflict] += 1
+            continue
+        root = sets.union(root1, root2)
+        absorbed = root2 if root == root1 else root1
+        signatures[root].update(signatures[absorbed])
+        signatures[absorbed] = None
+
+    components = {}
+    for position, product in enumerate(bucket):
+        components.setdefault(sets.find(position), []).append(product.name)
+    return [sorted(members, key=name_sort_key) for members in components.values()]
+
+
+def collapse_duplicates(product_names, features):
+    """Split distinct names into representatives and the twins each one stands for
+
+    Names with the same token set, variant keywords, size and variant
+    bucket ("Samsung TV 32in", "samsung-tv 32in", "TV Samsung 32in") look
+    the same to grouping, so only the first of them needs to be matched.
+    Names without tokens never match each other and are kept apart.
+    Returns ``(representatives, twins)``: representatives in input order
+    and a dict from representative to its later twins.
+    """
+    firsts = {}
+    representatives = []
+    twins = {}
+    for name in product_names:
+        product = features[name]
+        if product.token_set:
+            key = (product.variant_key, product.token_set, product.variant_set, product.size)
+            first = firsts.setdefault(key, name)
+            if first is not name:
+                twins.setdefault(first, []).append(name)
+                continue
+        representatives.append(name)
+    return representatives, twins
+
+
+def _expand_groups(groups, twins, order_key):
+    """Put twins back into the groups of their representatives, members sorted by ``order_key``"""
+    expanded = []
+    for group in groups:
+        if any(name in twins for name in group):
+            group = sorted((member for name in group for member in (name, *twins.get(name, ()))), key=order_key)
+        expanded.append(group)
+    return expanded
+
+
+def variant_buckets(product_names, features):
+    """Split distinct names by their variant key, keeping input order within and across buckets"""
+    variant_groups = {}
+    for name in dict.fromkeys(product_names):
+        # Create a key from sorted variant tokens
+        variant_key = features[name].variant_key
+        if variant_key not in variant_groups:
+            variant_groups[variant_key] = []
+        variant_groups[variant_key].append(name)
+    return variant_groups
+
+
+def group_similar_products(product_names, config=None, features=None, pool=None, run_profile=None):
+    """Group similar product names together
+
+    With ``config.clustering == 'greedy'`` (the default) names are grouped
+    around seeds in input order; names that look the same to grouping (see
+    :func:`collapse_duplicates`) are matched once and share their group.
+    ``'union_find'`` clusters the thresholded
+    similarity graph instead, so the groups, their members and their order
+    do not depend on the order of ``product_names``.
+
+    Buckets are grouped on ``pool`` (a :class:`~cleansheet.parallel.WorkerPool`)
+    when given, or on a temporary pool when ``config.workers > 1``. Stage
+    timings, pair counters and bucket and group sizes are added to
+    ``run_profile`` (a :class:`~cleansheet.profiling.RunProfile`) when given.
+    """
+    config = config or DEFAULT_CONFIG
+    if features is None:
+        features = FeatureCache()
+    if run_profile is None:
+        run_profile = RunProfile()
+    product_names = list(dict.fromkeys(product_names))
+
+    with run_profile.stage('features'):
+        for name in product_names:
+            features[name]
+
+    # Names that look the same to grouping are matched once. Greedy groups
+    # always take twins along with their representative; union-find merge
+    # order depends on every edge, and twins shift TF-IDF weights and top-k
+    # neighbours, so those match all names.
+    representatives, twins = product_names, {}
+    if config.clustering == 'greedy' and config.pair_engine != 'tfidf':
+        with run_profile.stage('collapsing'):
+            representatives, twins = collapse_duplicates(product_names, features)
+        run_profile.count('twins_collapsed', len(product_names) - len(representatives))
+
+    # Group products by variant tokens first
+    with run_profile.stage('bucketing'):
+        variant_groups = variant_buckets(representatives, features)
+    run_profile.histogram('bucket_sizes', map(len, variant_groups.values()))
+
+    with run_profile.stage('pair scoring'):
+        if pool is None and config.workers > 1:
+            from .parallel import WorkerPool
+
+            with WorkerPool(product_names, features, config) as pool:
+                groups = _group_buckets(variant_groups, config, features, pool, run_profile.counters)
+        else:
+            groups = _group_buckets(variant_groups, config, features, pool, run_profile.counters)
+
+    if twins:
+        # Members come back in input order, as a run without collapsing gives them
+        with run_profile.stage('collapsing'):
+            positions = {name: position for position, name in enumerate(product_names)}
+            groups = _expand_groups(groups, twins, positions.__getitem__)
+
+    run_profile.histogram('group_sizes', map(len, groups))
+    return groups
+
+
+def _group_buckets(variant_groups, config, features, pool, counts):
+    """Groups of every variant bucket, in bucket order"""
+    groups = []
+    if pool is not None:
+        shared = [products for products in variant_groups.values() if len(products) > 1]
+        bucket_groups = iter(pool.group_buckets(shared, counts))
+
+    # Now process each variant group separately
+    for variant_key, variant_products in variant_groups.items():
+        # Skip processing if there's only one product in this variant group
+        if len(variant_products) == 1:
+            groups.append(variant_products)
+            continue
+
+        if pool is not None:
+            groups.extend(next(bucket_groups))
+            continue
+
+        bucket = [features[name] for name in variant_products]
+        if config.clustering == 'union_find':
+            groups.extend(_union_find_groups(bucket, config, counts))
+        else:
+            groups.extend(_greedy_groups(bucket, config, counts))
+
+    if config.clustering == 'union_find':
+        groups.sort(key=lambda group: name_sort_key(group[0]))
+
+    return groups
+
+
+def score_confidence(product, standardized, config=None):
+    """Confidence that a product is correctly represented by its standardized name"""
+    confidence = features_similarity(product, standardized)
+
+    # Adjust based on whether variants and sizes match
+    if features_variant_conflict(product, standardized, config):
+        confidence *= 0.5
+
+    if features_size_conflict(product, standardized, config):
+        confidence *= 0.5
+
+    return confidence
+
+
+def standardize_groups(groups, config=None, features=None, mapping=None, confidence_scores=None, pool=None,
+                       run_profile=None):
+    """Standardize every member of the given groups and score its confidence
+
+    Results are added to ``mapping`` and ``confidence_scores`` (new dicts
+    when omitted), which are returned. Groups are spread over ``pool`` when
+    given, or over a temporary pool when ``config.workers > 1``; workers
+    score confidence together with standardization, so ``run_profile``
+    then has no separate confidence stage.
+    """
+    config = config or DEFAULT_CONFIG
+    if features is None:
+        features = FeatureCache()
+    if run_profile is None:
+        run_profile = RunProfile()
+    mapping = {} if mapping is None else mapping
+    confidence_scores = {} if confidence_scores is None else confidence_scores
+
+    if pool is None and config.workers > 1 and groups:
+        from .parallel import WorkerPool
+
+        with WorkerPool((name for group in groups for name in group), features, config) as pool:
+            return standardize_groups(groups, config, features, mapping, confidence_scores, pool, run_profile)
+
+    if pool is not None:
+        with run_profile.stage('standardization'):
+            for group, members in zip(groups, pool.standardize(groups)):
+                for name, (std_name, confidence) in zip(group, members):
+                    mapping[name] = std_name
+                    confidence_scores[name] = confidence
+        return mapping, confidence_scores
+
+    with run_profile.stage('standardization'):
+        for group in groups:
+            # Create standardized names for each product in the group
+            profile = GroupProfile(group, features)
+            for name in group:
+                mapping[name] = standardize_product_name(name, group, features, profile)
+
+    with run_profile.stage('confidence'):
+        for group in groups:
+            for name in group:
+                confidence_scores[name] = score_confidence(features[name], features[mapping[name]], config)
+
+    return mapping, confidence_scores
+
+
+def create_standardized_mapping(product_names, config=None, store=None, run_profile=None):
+    """Create a mapping from original names to standardized names
+
+    With a :class:`~cleansheet.store.MatchStore`, labels already matched
+    under the same settings are read from the store and only the misses are
+    grouped and standardized (among themselves); the new results are then
+    written back. Stage timings and counters are added to ``run_profile``
+    (a :class:`~cleansheet.profiling.RunProfile`) when given.
+    """
+    config = config or DEFAULT_CONFIG
+    if run_profile is None:
+        run_profile = RunProfile()
+    features = FeatureCache()
+    mapping = {}
+    confidence_scores = {}
+    regex_calls = regex_call_count()
+
+    product_names = list(product_names)
+    labels = product_names
+    cached = {}
+    if store is not None:
+        with run_profile.stage('store'):
+            cached = store.lookup(product_names, config)
+        product_names = [name for name in product_names if name not in cached]
+        run_profile.count('store_hits', len(cached))
+
+    if config.workers > 1 and product_names:
+        from .parallel import WorkerPool
+
+        # One pool for both stages, so features are shipped to each worker once
+        with run_profile.stage('features'):
+            for name in product_names:
+                features[name]
+        with WorkerPool(product_names, features, config) as pool:
+            groups = group_similar_products(product_names, config, features, pool, run_profile)
+            standardize_groups(groups, config, features, mapping, confidence_scores, pool, run_profile)
+    else:
+        groups = group_similar_products(product_names, config, features, run_profile=run_profile)
+        standardize_groups(groups, config, features, mapping, confidence_scores, run_profile=run_profile)
+
+    if store is not None:
+        with run_profile.stage('store'):
+            store.save(((name, mapping[name], confidence_scores[name], features[name]) for name in mapping),
+                       config)
+        # Misses in group order as without a store, then hits in input order
+        for name in labels:
+            if name in cached and name not in mapping:
+                mapping[name], confidence_scores[name] = cached[name]
+
+    run_profile.count('labels', len(mapping))
+    run_profile.count('regex_calls', regex_call_count() - regex_calls)
+    return mapping, confidence_scores
@@ -0,0 +1,151 @@
+"""Read and write CSV, Parquet and Arrow IPC tables with column projection.
+
+Only the columns that are needed (a label and its metrics) are read from
+each input. Parquet and Arrow IPC (Feather v2, file or stream format)
+need ``pyarrow``; CSV works without it and uses pandas' pyarrow parser
+when it is installed. The format is taken from the file extension unless
+given explicitly.
+"""
+
+import io
+import os
+
+import pandas as pd
+
+FORMATS = ('csv', 'parquet', 'arrow')
+
+_EXTENSIONS = {
+    '.csv': 'csv',
+    '.txt': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.ipc': 'arrow',
+    '.arrows': 'arrow',
+}
+
+
+def detect_format(name, default='csv'):
+    """Table format for a file name or path, from its extension"""
+    if not isinstance(name, (str, os.PathLike)):
+        name = getattr(name, 'name', '')
+    extension = os.path.splitext(str(name))[1].lower()
+    return _EXTENSIONS.get(extension, default)
+
+
+def _require_pyarrow(fmt):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError(f"Reading or writing {fmt} files needs pyarrow: pip install pyarrow") from None
+
+
+def _csv_engine():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return 'c'
+    return 'pyarrow'
+
+
+def _rewind(source):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source
+
+
+def _arrow_reader(source):
+    """Record batch reader for an Arrow IPC file or stream"""
+    import pyarrow as pa
+
+    if isinstance(source, (str, os.PathLike)):
+        source = pa.memory_map(os.fspath(source))
+    try:
+        return pa.ipc.open_file(_rewind(source))
+    except pa.ArrowInvalid:
+        # Not the random-access file format, so read it as a stream
+        return pa.ipc.open_stream(_rewind(source))
+
+
+def _arrow_batches(reader):
+    if hasattr(reader, 'num_record_batches'):
+        for index in range(reader.num_record_batches):
+            yield reader.get_batch(index)
+    else:
+        yield from reader
+
+
+def read_columns(source, fmt=None):
+    """Column names of a table, without reading its rows"""
+    fmt = fmt or detect_format(source)
+    if fmt == 'parquet':
+        _require_pyarrow(fmt)
+        import pyarrow.parquet as pq
+
+        return list(pq.ParquetFile(_rewind(source)).schema_arrow.names)
+    if fmt == 'arrow':
+        _require_pyarrow(fmt)
+        return list(_arrow_reader(source).schema.names)
+    return pd.read_csv(_rewind(source), nrows=0).columns.tolist()
+
+
+def read_table(source, columns=None, fmt=None, label_col=None):
+    """Read a table, or only ``columns`` of it, into a DataFrame
+
+    CSV values of ``label_col`` are read as text, as :func:`read_batches`
+    reads labels, so labels such as dates or numbers are not converted.
+    """
+    fmt = fmt or detect_format(source)
+    columns = list(columns) if columns is not None else None
+    if fmt == 'parquet':
+        _require_pyarrow(fmt)
+        return pd.read_parquet(_rewind(source), columns=columns)
+    if fmt == 'arrow':
+        _require_pyarrow(fmt)
+        import pyarrow as pa
+
+        table = pa.Table.from_batches(list(_arrow_batches(_arrow_reader(source))))
+        if columns is not None:
+            table = table.select(columns)
+        return table.to_pandas()
+    dtype = {label_col: str} if label_col is not None else None
+    return pd.read_csv(_rewind(source), usecols=columns, dtype=dtype, engine=_csv_engine())
+
+
+def read_batches(source, columns, chunksize, fmt=None):
+    """Yield DataFrames of ``columns`` only, about ``chunksize`` rows at a time
+
+    CSV labels (the first column) are read as text so every chunk parses
+    them the same way. Arrow IPC batches are yielded as they were written.
+    """
+    fmt = fmt or detect_format(source)
+    columns = list(columns)
+    if fmt == 'parquet':
+        _require_pyarrow(fmt)
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(_rewind(source)).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif fmt == 'arrow':
+        _require_pyarrow(fmt)
+        for batch in _arrow_batches(_arrow_reader(source)):
+            yield batch.select(columns).to_pandas()
+    else:
+        # Buffers are read once per pass
+        yield from pd.read_csv(_rewind(source), usecols=columns, dtype={columns[0]: str}, chunksize=chunksize)
+
+
+def write_table(df, target=None, fmt='csv'):
+    """Write ``df`` without its index to a path or buffer, or return it as bytes when ``target`` is None"""
+    if fmt not in ('csv', 'parquet'):
+        raise ValueError(f"Output format must be 'csv' or 'parquet', got {fmt!r}")
+    buffer = io.BytesIO() if target is None else target
+    if fmt == 'parquet':
+        _require_pyarrow(fmt)
+        df.to_parquet(buffer, index=False)
+    elif target is None:
+        buffer.write(df.to_csv(index=False).encode('utf-8'))
+    else:
+        df.to_csv(target, index=False)
+    return buffer.getvalue() if target is None else None
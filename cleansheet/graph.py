@@ -0,0 +1,202 @@
+"""Scored similarity graph that can be re-cut at new settings without rescoring.
+
+Building a :class:`MatchGraph` scores every candidate pair of each variant
+bucket once, down to a similarity ``floor``, and stores each edge with its
+Jaccard score and its variant and size conflict flags. Changing
+``min_similarity`` (at or above the floor), ``variant_protection``,
+``size_protection`` or ``manual_review_threshold`` then only re-cuts the
+stored edges into groups. Standardized names are cached per group, so only
+groups whose membership changed are re-standardized. The results are the
+same as :func:`~cleansheet.engine.create_standardized_mapping` with the
+new settings. With ``pair_engine='minhash'`` and a band layout derived from
+``min_similarity``, the graph keeps the layout of the threshold it was built
+for and only covers thresholds that derive the same layout.
+"""
+
+from dataclasses import asdict, replace
+
+from .config import DEFAULT_CONFIG
+from .engine import (
+    FeatureCache,
+    GroupProfile,
+    _candidate_source,
+    _merge_edges,
+    features_size_conflict,
+    features_variant_conflict,
+    name_sort_key,
+    regex_call_count,
+    score_confidence,
+    standardize_product_name,
+    variant_buckets,
+)
+from .lsh import band_layout
+from .profiling import RunProfile
+
+# Lowest threshold scored by default, below the usual tuning range
+DEFAULT_FLOOR = 0.5
+
+# Settings a graph can be re-cut for; any other change needs a new graph
+RECUT_SETTINGS = ('min_similarity', 'variant_protection', 'size_protection',
+                  'manual_review_threshold', 'workers')
+
+
+def _scoring_settings(config):
+    return {name: value for name, value in asdict(config).items() if name not in RECUT_SETTINGS}
+
+
+def _lsh_layout(config):
+    """``(bands, rows)`` the minhash engine uses for ``config``, or None for other engines"""
+    if config.pair_engine != 'minhash':
+        return None
+    if config.lsh_bands is not None:
+        return config.lsh_bands, config.lsh_rows
+    return band_layout(config.min_similarity)
+
+
+class MatchGraph:
+    """Candidate edges of a fixed label list, scored once and re-cut on demand"""
+
+    def __init__(self, product_names, config=None, floor=DEFAULT_FLOOR, run_profile=None):
+        config = config or DEFAULT_CONFIG
+        if run_profile is None:
+            run_profile = RunProfile()
+        self.floor = min(floor, config.min_similarity)
+        if self.floor <= 0:
+            raise ValueError("MatchGraph needs a positive similarity floor; "
+                             "with min_similarity 0 every pair in a bucket matches")
+        self.config = config
+        self.features = FeatureCache()
+        self.labels = list(dict.fromkeys(product_names))
+
+        regex_calls = regex_call_count()
+        with run_profile.stage('features'):
+            for name in self.labels:
+                self.features[name]
+        with run_profile.stage('bucketing'):
+            buckets = variant_buckets(self.labels, self.features)
+        run_profile.histogram('bucket_sizes', map(len, buckets.values()))
+
+        # One (features, edges) entry per variant bucket, in grouping order;
+        # candidates come from the LSH layout of the requested threshold
+        self.lsh_layout = _lsh_layout(config)
+        scoring = replace(config, min_similarity=self.floor)
+        if self.lsh_layout is not None:
+            scoring = replace(scoring, lsh_bands=self.lsh_layout[0], lsh_rows=self.lsh_layout[1])
+        self.buckets = []
+        with run_profile.stage('pair scoring'):
+            for names in buckets.values():
+                bucket = [self.features[name] for name in names]
+                self.buckets.append((bucket, self._score(bucket, scoring, run_profile.counters)
+                                     if len(bucket) > 1 else []))
+        run_profile.count('regex_calls', regex_call_count() - regex_calls)
+
+        # Standardized names per group membership, reused across cuts
+        self._standardized = {}
+
+    @staticmethod
+    def _score(bucket, config, counts):
+        """``(i, j, similarity, variant_conflict, size_conflict)`` for every pair above the floor
+
+        Conflict flags are recorded with protection on; the cut decides
+        whether they apply.
+        """
+        candidates_for, _, similarity_of = _candidate_source(bucket, config)
+        edges = []
+        for i, features1 in enumerate(bucket):
+            for j in candidates_for(i):
+                if j <= i:
+                    continue
+                counts['pairs_scored'] += 1
+                features2 = bucket[j]
+                similarity = similarity_of(i, j)
+                if similarity >= config.min_similarity:
+                    edges.append((i, j, similarity,
+                                  features_variant_conflict(features1, features2, DEFAULT_CONFIG),
+                                  features_size_conflict(features1, features2, DEFAULT_CONFIG)))
+        return edges
+
+    @property
+    def edge_count(self):
+        return sum(len(edges) for _, edges in self.buckets)
+
+    def covers(self, config, product_names=None):
+        """Whether ``config`` (and ``product_names``, if given) can be served by re-cutting this graph"""
+        if config.min_similarity < self.floor:
+            return False
+        if _scoring_settings(config) != _scoring_settings(self.config):
+            return False
+        if _lsh_layout(config) != self.lsh_layout:
+            return False
+        return product_names is None or list(dict.fromkeys(product_names)) == self.labels
+
+    def groups(self, config):
+        """Groups for ``config``, as :func:`~cleansheet.engine.group_similar_products` returns them"""
+        if not self.covers(config):
+            raise ValueError("Settings are outside what this graph was scored for; build a new MatchGraph")
+
+        groups = []
+        for bucket, edges in self.buckets:
+            # Skip processing if there's only one product in this variant group
+            if len(bucket) == 1:
+                groups.append([bucket[0].name])
+            elif config.clustering == 'union_find':
+                kept = [(i, j, similarity) for i, j, similarity, _, _ in edges
+                        if similarity >= config.min_similarity]
+                groups.extend(_merge_edges(bucket, kept, config))
+            else:
+                groups.extend(self._greedy_cut(bucket, edges, config))
+
+        if config.clustering == 'union_find':
+            groups.sort(key=lambda group: name_sort_key(group[0]))
+        return groups
+
+    @staticmethod
+    def _greedy_cut(bucket, edges, config):
+        """Greedy seeding over the stored edges; earlier names are always seeds or taken"""
+        neighbours = [[] for _ in bucket]
+        for i, j, similarity, variant_conflict, _ in edges:
+            if similarity >= config.min_similarity and not (config.variant_protection and variant_conflict):
+                neighbours[i].append(j)
+
+        groups = []
+        assigned = [False] * len(bucket)
+        for i, product in enumerate(bucket):
+            if assigned[i]:
+                continue
+            assigned[i] = True
+            current_group = [product.name]
+            for j in neighbours[i]:
+                if not assigned[j]:
+                    assigned[j] = True
+                    current_group.append(bucket[j].name)
+            groups.append(current_group)
+        return groups
+
+    def mapping(self, config, run_profile=None):
+        """``(mapping, confidence_scores)`` for ``config``, re-standardizing only changed groups"""
+        if run_profile is None:
+            run_profile = RunProfile()
+        features = self.features
+        regex_calls = regex_call_count()
+        with run_profile.stage('re-cut'):
+            groups = self.groups(config)
+        run_profile.histogram('group_sizes', map(len, groups))
+
+        mapping = {}
+        with run_profile.stage('standardization'):
+            for group in groups:
+                key = tuple(group)
+                standardized = self._standardized.get(key)
+                if standardized is None:
+                    profile = GroupProfile(group, features)
+                    standardized = [standardize_product_name(name, group, features, profile) for name in group]
+                    self._standardized[key] = standardized
+                    run_profile.count('groups_standardized')
+                mapping.update(zip(group, standardized))
+
+        with run_profile.stage('confidence'):
+            confidence_scores = {name: score_confidence(features[name], features[std_name], config)
+                                 for name, std_name in mapping.items()}
+        run_profile.count('labels', len(mapping))
+        run_profile.count('regex_calls', regex_call_count() - regex_calls)
+        return mapping, confidence_scores
@@ -0,0 +1,197 @@
+"""Add new labels to a saved grouping without regrouping the whole catalog.
+
+A :class:`MatchGrouping` keeps the groups of a finished run together with
+the features of each group's seed and an inverted token index over those
+seeds. New labels are assigned with the same rule as greedy clustering: a
+label joins the first group (in seed order) whose seed is in the same
+size/variant bucket, has no variant conflict with it and reaches
+``min_similarity``; otherwise it seeds a new group. Adding labels this way
+gives the same groups as a full greedy run with the new labels appended to
+the input. Only the groups that received labels are re-standardized. Seeds
+are scored with exact token Jaccard, so only the ``index`` and ``sparse``
+pair engines are supported.
+
+Typical use::
+
+    grouping = MatchGrouping.build(master_labels, config)
+    grouping.save('master_grouping.json.gz')
+
+    grouping = MatchGrouping.load('master_grouping.json.gz')
+    mapping, confidence = grouping.add_labels(todays_labels)
+    grouping.save('master_grouping.json.gz')
+"""
+
+import dataclasses
+import gzip
+import json
+
+from .config import DEFAULT_CONFIG, MatchConfig
+from .engine import (
+    FeatureCache,
+    ProductFeatures,
+    features_similarity,
+    features_variant_conflict,
+    group_similar_products,
+    prefix_length,
+    standardize_groups,
+)
+from .store import settings_key
+
+# Bumped whenever the saved layout changes
+FORMAT_VERSION = 1
+
+
+def _open(path, mode):
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class MatchGrouping:
+    """Groups of a finished greedy run that new labels can be added to"""
+
+    def __init__(self, config=None):
+        config = config or DEFAULT_CONFIG
+        if config.clustering != 'greedy':
+            raise ValueError("Incremental matching follows greedy seeding; "
+                             f"clustering={config.clustering!r} is not supported")
+        if config.pair_engine in ('minhash', 'tfidf'):
+            raise ValueError("Incremental matching scores exact token Jaccard against seeds; "
+                             f"pair_engine={config.pair_engine!r} is not supported")
+        self.config = config
+        self.groups = []
+        self.seeds = []
+        self.mapping = {}
+        self.confidence_scores = {}
+        # (variant_key, token) -> ids of the groups whose seed has the token
+        self.postings = {}
+        # variant_key -> ids of the groups seeded in that bucket
+        self.buckets = {}
+
+    @classmethod
+    def build(cls, product_names, config=None):
+        """Group and standardize ``product_names`` from scratch"""
+        grouping = cls(config)
+        features = FeatureCache()
+        for group in group_similar_products(product_names, grouping.config, features):
+            grouping._add_group(group, features[group[0]])
+        standardize_groups(grouping.groups, grouping.config, features,
+                           grouping.mapping, grouping.confidence_scores)
+        return grouping
+
+    def __len__(self):
+        return len(self.mapping)
+
+    def _add_group(self, members, seed):
+        group_id = len(self.groups)
+        self.groups.append(members)
+        self.seeds.append(seed)
+        self.buckets.setdefault(seed.variant_key, []).append(group_id)
+        for token in seed.token_set:
+            self.postings.setdefault((seed.variant_key, token), []).append(group_id)
+        return group_id
+
+    def _candidate_groups(self, product):
+        """Ascending ids of the groups whose seed may reach the threshold with ``product``"""
+        key = product.variant_key
+        threshold = self.config.min_similarity
+        if threshold <= 0:
+            return self.buckets.get(key, [])
+
+        tokens = product.token_set
+        if not tokens:
+            return []
+
+        # Any ``size - ceil(t * size) + 1`` tokens of the new label must
+        # include one it shares with a qualifying seed, so probing the
+        # rarest ones keeps the candidate lists short
+        postings = self.postings
+        ordered = sorted(tokens, key=lambda token: (len(postings.get((key, token), ())), token))
+        found = set()
+        for token in ordered[:prefix_length(len(ordered), threshold)]:
+            found.update(postings.get((key, token), ()))
+        return sorted(found)
+
+    def find_group(self, product):
+        """Id of the group a new label's features would join, or None"""
+        for group_id in self._candidate_groups(product):
+            seed = self.seeds[group_id]
+            if features_variant_conflict(seed, product, self.config):
+                continue
+            if features_similarity(seed, product) >= self.config.min_similarity:
+                return group_id
+        return None
+
+    def add_labels(self, product_names):
+        """Assign new labels to existing or new groups and re-standardize those groups
+
+        Labels that are already part of the grouping are ignored. Returns
+        ``(mapping, confidence_scores)`` for every member of the affected
+        groups, since adding a label can change its group's standardized name.
+        """
+        features = FeatureCache()
+        affected = {}
+        for name in dict.fromkeys(product_names):
+            if name in self.mapping:
+                continue
+            product = features[name]
+            group_id = self.find_group(product)
+            if group_id is None:
+                group_id = self._add_group([name], product)
+            else:
+                self.groups[group_id].append(name)
+            affected[group_id] = None
+
+        groups = [self.groups[group_id] for group_id in affected]
+        mapping, confidence_scores = standardize_groups(groups, self.config, features)
+        self.mapping.update(mapping)
+        self.confidence_scores.update(confidence_scores)
+        return mapping, confidence_scores
+
+    def to_dict(self):
+        """Plain, JSON-serialisable form of the grouping"""
+        return {
+            'format': FORMAT_VERSION,
+            'settings_key': settings_key(self.config),
+            'config': dataclasses.asdict(self.config),
+            'groups': [
+                {
+                    'members': members,
+                    'seed': seed.to_record(),
+                    'standardized': [self.mapping[name] for name in members],
+                    'confidence': [self.confidence_scores[name] for name in members],
+                }
+                for members, seed in zip(self.groups, self.seeds)
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a grouping saved with :meth:`to_dict`
+
+        Raises ``ValueError`` when the data was written by another format
+        version, or under different matching rules or stopwords.
+        """
+        if data.get('format') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported grouping format {data.get('format')!r}")
+        grouping = cls(MatchConfig(**data['config']))
+        if data['settings_key'] != settings_key(grouping.config):
+            raise ValueError("Grouping was saved under different matching rules or stopwords; rebuild it")
+
+        for group in data['groups']:
+            members = group['members']
+            grouping._add_group(members, ProductFeatures.from_record(members[0], group['seed']))
+            grouping.mapping.update(zip(members, group['standardized']))
+            grouping.confidence_scores.update(zip(members, group['confidence']))
+        return grouping
+
+    def save(self, path):
+        """Write the grouping as JSON (gzip-compressed when ``path`` ends in ``.gz``)"""
+        with _open(path, 'w') as handle:
+            json.dump(self.to_dict(), handle, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path):
+        """Read a grouping written by :meth:`save`"""
+        with _open(path, 'r') as handle:
+            return cls.from_dict(json.load(handle))
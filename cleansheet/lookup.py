@@ -0,0 +1,192 @@
+"""Top-k lookup of standardized names for new labels against a finished run.
+
+A :class:`MatchIndex` keeps the standardized names of a run together with
+token postings over the distinct token sets of their members. Looking up a
+label scores it against every member that shares a token with it (token
+Jaccard, as the default pair engines use), in any size/variant bucket, and
+returns the best-scoring standardized names with variant and size conflict
+flags for their closest member. Candidates that grouping would never have
+matched with the label (another size, a clashing variant) are flagged
+rather than dropped. The index is read-only after it is built and lookups
+keep no state, so one index can serve queries for the life of a process::
+
+    index = MatchIndex.build(master_labels, config)
+    index.lookup('samsung tv 32"', k=3)
+    index.lookup_many(todays_labels, k=1)
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+from scipy import sparse
+
+from .config import DEFAULT_CONFIG
+from .engine import (
+    FeatureCache,
+    ProductFeatures,
+    features_size_conflict,
+    features_variant_conflict,
+    group_similar_products,
+    standardize_groups,
+)
+
+DEFAULT_K = 5
+
+# Labels counted per sparse matrix product in lookup_many
+_BLOCK_SIZE = 256
+
+
+@dataclass(frozen=True)
+class Candidate:
+    """One standardized name returned by :meth:`MatchIndex.lookup`
+
+    ``member`` is the label of the run that scored best; the conflict flags
+    compare the looked-up label with that member under the index settings.
+    """
+
+    standardized_name: object
+    score: float
+    member: object
+    variant_conflict: bool
+    size_conflict: bool
+
+
+class MatchIndex:
+    """Standardized names of a finished run with token postings for top-k lookups"""
+
+    def __init__(self, mapping, config=None, features=None):
+        config = config or DEFAULT_CONFIG
+        if features is None:
+            features = FeatureCache()
+        self.config = config
+        self.standardized_names = []
+        # Entry -> features of the first member with that token set in its group
+        self.members = []
+        # Token -> posting list id
+        self.vocabulary = {}
+
+        group_ids = {}
+        entry_groups = []
+        seen = set()
+        indptr = [0]
+        indices = []
+        for name, standardized in mapping.items():
+            product = features[name]
+            if not product.token_set:
+                continue
+            group_id = group_ids.get(standardized)
+            if group_id is None:
+                group_id = group_ids[standardized] = len(self.standardized_names)
+                self.standardized_names.append(standardized)
+            if (group_id, product.token_set) in seen:
+                continue
+            seen.add((group_id, product.token_set))
+
+            self.members.append(product)
+            entry_groups.append(group_id)
+            for token in product.token_set:
+                indices.append(self.vocabulary.setdefault(token, len(self.vocabulary)))
+            indptr.append(len(indices))
+
+        self.entry_groups = np.asarray(entry_groups, dtype=np.int64)
+        self.entry_sizes = np.diff(np.asarray(indptr, dtype=np.float64))
+        entries = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), np.asarray(indices, dtype=np.int64),
+             np.asarray(indptr, dtype=np.int64)),
+            shape=(len(self.members), max(len(self.vocabulary), 1)))
+        # Posting list id -> ascending entries that contain the token
+        self.postings = entries.T.tocsr()
+
+    @classmethod
+    def build(cls, product_names, config=None):
+        """Group and standardize ``product_names``, then index the result"""
+        config = config or DEFAULT_CONFIG
+        features = FeatureCache()
+        groups = group_similar_products(product_names, config, features)
+        mapping, _ = standardize_groups(groups, config, features)
+        return cls(mapping, config, features)
+
+    def __len__(self):
+        return len(self.standardized_names)
+
+    def _token_ids(self, product):
+        vocabulary = self.vocabulary
+        return [vocabulary[token] for token in product.token_set if token in vocabulary]
+
+    def lookup(self, label, k=DEFAULT_K):
+        """Up to ``k`` :class:`Candidate` standardized names for ``label``, best first
+
+        Only names with a member that shares at least one token are
+        returned. Ties go to the name that came first in the run.
+        """
+        # Not cached, so a long-lived index does not grow with its queries
+        product = ProductFeatures(label)
+        token_ids = self._token_ids(product)
+        if not token_ids:
+            return []
+
+        postings = self.postings
+        entries = np.concatenate([postings.indices[postings.indptr[token_id]:postings.indptr[token_id + 1]]
+                                  for token_id in token_ids])
+        # Shared tokens per entry from runs of the sorted entry ids (cheaper than np.unique)
+        entries.sort()
+        starts = np.flatnonzero(np.concatenate(([True], entries[1:] != entries[:-1])))
+        shared = np.diff(np.append(starts, len(entries)))
+        entries = entries[starts]
+        return self._candidates(product, entries, shared, k)
+
+    def lookup_many(self, labels, k=DEFAULT_K):
+        """:meth:`lookup` for a batch of labels, with shared tokens counted by sparse matrix products"""
+        results = []
+        labels = list(labels)
+        for start in range(0, len(labels), _BLOCK_SIZE):
+            products = [ProductFeatures(label) for label in labels[start:start + _BLOCK_SIZE]]
+            indptr = [0]
+            indices = []
+            for product in products:
+                indices.extend(self._token_ids(product))
+                indptr.append(len(indices))
+            queries = sparse.csr_matrix(
+                (np.ones(len(indices), dtype=np.int32), np.asarray(indices, dtype=np.int64),
+                 np.asarray(indptr, dtype=np.int64)),
+                shape=(len(products), self.postings.shape[0]))
+
+            shared = queries @ self.postings
+            for row, product in enumerate(products):
+                row_slice = slice(shared.indptr[row], shared.indptr[row + 1])
+                results.append(self._candidates(product, shared.indices[row_slice], shared.data[row_slice], k)
+                               if row_slice.start < row_slice.stop else [])
+        return results
+
+    def _candidates(self, product, entries, shared, k):
+        """Top-k candidates for one label from the entries it shares tokens with"""
+        scores = shared / (self.entry_sizes[entries] + len(product.token_set) - shared)
+
+        # Entries scoring at least the n-th best hold the best entry of every
+        # top-k name whenever they cover k names, so only those are sorted
+        count = 4 * k
+        while count < len(scores):
+            cutoff = np.partition(scores, len(scores) - count)[len(scores) - count]
+            kept = scores >= cutoff
+            if len(np.unique(self.entry_groups[entries[kept]])) >= k:
+                entries, scores = entries[kept], scores[kept]
+                break
+            count *= 4
+
+        # Best entry per name, strongest first, ties to the earlier entry
+        order = np.lexsort((entries, -scores))
+        _, firsts = np.unique(self.entry_groups[entries[order]], return_index=True)
+        best = order[np.sort(firsts)[:k]]
+
+        config = self.config
+        candidates = []
+        for entry, score in zip(entries[best].tolist(), scores[best].tolist()):
+            member = self.members[entry]
+            candidates.append(Candidate(
+                standardized_name=self.standardized_names[self.entry_groups[entry]],
+                score=score,
+                member=member.name,
+                variant_conflict=features_variant_conflict(product, member, config),
+                size_conflict=features_size_conflict(product, member, config),
+            ))
+        return candidates
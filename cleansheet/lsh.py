@@ -0,0 +1,234 @@
+"""Approximate candidate generation with MinHash signatures and banded LSH.
+
+Each label's token set is summarised by ``bands * rows`` MinHash values.
+Labels that agree on every value of at least one band land in the same
+bucket and become candidate pairs; candidates are then verified with exact
+Jaccard, so the mode can miss pairs (lower recall) but never adds pairs
+below the threshold. A pair with Jaccard ``s`` becomes a candidate with
+probability ``1 - (1 - s ** rows) ** bands``.
+
+Unless given, the band layout is derived from the threshold by
+:func:`band_layout`, so the steep part of that curve sits at the threshold.
+A layout centred well below it (16 x 4 puts it near 0.5) collects many times
+more candidates than there are matching pairs, and verifying them makes
+the mode slower than exact matching.
+"""
+
+import functools
+import time
+import tracemalloc
+import zlib
+
+import numpy as np
+
+DEFAULT_BANDS = 16
+DEFAULT_ROWS = 4
+DEFAULT_SEED = 1
+
+# Hash values per signature when the layout is derived from the threshold
+DEFAULT_NUM_PERM = 64
+
+# Weight of missed pairs against extra candidates when picking a layout
+FALSE_NEGATIVE_WEIGHT = 0.7
+
+# Mersenne prime used for the universal hash family, as in the usual MinHash setup
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_CHUNK_SIZE = 8192
+
+
+def collision_probability(similarity, bands=DEFAULT_BANDS, rows=DEFAULT_ROWS):
+    """Probability that a pair with the given Jaccard similarity becomes a candidate"""
+    return 1.0 - (1.0 - similarity ** rows) ** bands
+
+
+@functools.lru_cache(maxsize=None)
+def band_layout(threshold, num_perm=DEFAULT_NUM_PERM, false_negative_weight=FALSE_NEGATIVE_WEIGHT):
+    """``(bands, rows)`` with ``bands * rows <= num_perm`` that best separates pairs at ``threshold``
+
+    Minimises the weighted area of collision probability below the
+    threshold (extra candidates) and of miss probability above it (lost
+    pairs). For 0.7 this gives 10 x 6.
+    """
+    below = np.linspace(0.0, threshold, 101)
+    above = np.linspace(threshold, 1.0, 101)
+    best = None
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            false_positives = collision_probability(below, bands, rows).mean() * threshold
+            false_negatives = (1.0 - collision_probability(above, bands, rows)).mean() * (1.0 - threshold)
+            error = (1.0 - false_negative_weight) * false_positives + false_negative_weight * false_negatives
+            if best is None or error < best[0]:
+                best = (error, bands, rows)
+    return best[1], best[2]
+
+
+def _token_hashes(token_sets):
+    """Vocabulary-level 32-bit token hashes plus CSR-style token ids per set"""
+    vocabulary = {}
+    indptr = [0]
+    indices = []
+    for tokens in token_sets:
+        for token in tokens:
+            indices.append(vocabulary.setdefault(token, len(vocabulary)))
+        indptr.append(len(indices))
+
+    # crc32 is stable across processes, unlike hash() on str
+    hashes = np.fromiter((zlib.crc32(token.encode('utf-8')) for token in vocabulary),
+                         dtype=np.uint64, count=len(vocabulary))
+    return hashes, np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)
+
+
+def _permutations(num_perm, seed):
+    generator = np.random.RandomState(seed)
+    a = generator.randint(1, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64)
+    b = generator.randint(0, np.iinfo(np.int64).max, size=num_perm, dtype=np.int64).astype(np.uint64)
+    return a % _MERSENNE_PRIME, b % _MERSENNE_PRIME
+
+
+def minhash_signatures(token_sets, num_perm=DEFAULT_BANDS * DEFAULT_ROWS, seed=DEFAULT_SEED):
+    """Return a ``(len(token_sets), num_perm)`` uint32 MinHash signature matrix
+
+    Empty token sets get the maximum hash in every position.
+    """
+    hashes, indices, indptr = _token_hashes(token_sets)
+    a, b = _permutations(num_perm, seed)
+
+    # Permuted hash of every vocabulary token, computed once
+    permuted = ((hashes[:, None] * a + b) % _MERSENNE_PRIME) & _MAX_HASH
+    permuted = permuted.astype(np.uint32)
+
+    signatures = np.full((len(token_sets), num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+    sizes = np.diff(indptr)
+    filled = np.flatnonzero(sizes)
+    if len(filled):
+        reduced = np.minimum.reduceat(permuted[indices], indptr[:-1][filled], axis=0)
+        signatures[filled] = reduced
+    return signatures
+
+
+def _band_keys(signatures, bands, rows):
+    """Collapse each band of a signature block to one 64-bit bucket key"""
+    keys = np.zeros((signatures.shape[0], bands), dtype=np.uint64)
+    multiplier = np.uint64(1099511628211)
+    for band in range(bands):
+        key = np.full(signatures.shape[0], 14695981039346656037, dtype=np.uint64)
+        for column in range(band * rows, (band + 1) * rows):
+            key = (key ^ signatures[:, column].astype(np.uint64)) * multiplier
+        keys[:, band] = key
+    return keys
+
+
+def candidate_pairs(token_sets, bands=DEFAULT_BANDS, rows=DEFAULT_ROWS, seed=DEFAULT_SEED):
+    """Return unique candidate pairs ``(i, j)`` with ``i < j`` as two int64 arrays"""
+    positions = np.asarray([position for position, tokens in enumerate(token_sets) if tokens], dtype=np.int64)
+    if len(positions) < 2:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+
+    # Signatures are built chunk by chunk so only the band keys stay resident
+    keys = np.empty((len(positions), bands), dtype=np.uint64)
+    for start in range(0, len(positions), _CHUNK_SIZE):
+        chunk = [token_sets[position] for position in positions[start:start + _CHUNK_SIZE]]
+        keys[start:start + len(chunk)] = _band_keys(minhash_signatures(chunk, bands * rows, seed), bands, rows)
+
+    encoded = []
+    count = np.int64(len(token_sets))
+    for band in range(bands):
+        order = np.argsort(keys[:, band], kind='stable')
+        sorted_keys = keys[order, band]
+        sorted_positions = positions[order]
+
+        # Pair every label with the ones `offset` places later in the same
+        # bucket; once no bucket is longer than `offset` we are done
+        offset = 1
+        while offset < len(sorted_keys):
+            same = sorted_keys[offset:] == sorted_keys[:-offset]
+            if not same.any():
+                break
+            left = sorted_positions[:-offset][same]
+            right = sorted_positions[offset:][same]
+            encoded.append(np.minimum(left, right) * count + np.maximum(left, right))
+            offset += 1
+
+    if not encoded:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    unique = np.unique(np.concatenate(encoded))
+    return unique // count, unique % count
+
+
+def _verified_pairs(token_sets, lefts, rights, threshold):
+    """Yield the candidate pairs whose exact Jaccard reaches the threshold"""
+    for left, right in zip(lefts.tolist(), rights.tolist()):
+        tokens1 = token_sets[left]
+        tokens2 = token_sets[right]
+        shared = len(tokens1 & tokens2)
+        if shared / (len(tokens1) + len(tokens2) - shared) >= threshold:
+            yield left, right
+
+
+def neighbour_lists(token_sets, threshold, bands=None, rows=None, seed=DEFAULT_SEED):
+    """For every position, the ascending later positions that collide and pass exact Jaccard
+
+    Without ``bands`` and ``rows`` the layout comes from :func:`band_layout`.
+    """
+    if bands is None or rows is None:
+        bands, rows = band_layout(threshold)
+    neighbours = [[] for _ in token_sets]
+    lefts, rights = candidate_pairs(token_sets, bands, rows, seed)
+    for left, right in _verified_pairs(token_sets, lefts, rights, threshold):
+        neighbours[left].append(right)
+    return neighbours
+
+
+def evaluate(token_sets, threshold, bands=None, rows=None, seed=DEFAULT_SEED):
+    """Measure recall, throughput and memory of LSH against exact blocked Jaccard
+
+    Returns a dict with the number of exact and found pairs, recall,
+    candidate count, LSH wall time, labels per second and peak traced
+    memory in bytes. Without ``bands`` and ``rows`` the layout comes from
+    :func:`band_layout`.
+    """
+    from .engine import TokenIndex
+
+    if bands is None or rows is None:
+        bands, rows = band_layout(threshold)
+
+    token_sets = [frozenset(tokens) for tokens in token_sets]
+
+    start = time.perf_counter()
+    lefts, rights = candidate_pairs(token_sets, bands, rows, seed)
+    found = set(_verified_pairs(token_sets, lefts, rights, threshold))
+    seconds = time.perf_counter() - start
+
+    # Tracing slows allocation down, so memory is measured on a second run
+    tracemalloc.start()
+    neighbour_lists(token_sets, threshold, bands, rows, seed)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    index = TokenIndex(token_sets, threshold)
+    exact_lefts = []
+    exact_rights = []
+    for left in range(len(token_sets)):
+        for right in index.candidates(left):
+            if right > left:
+                exact_lefts.append(left)
+                exact_rights.append(right)
+    exact = set(_verified_pairs(token_sets, np.asarray(exact_lefts, dtype=np.int64),
+                                np.asarray(exact_rights, dtype=np.int64), threshold))
+
+    return {
+        'labels': len(token_sets),
+        'bands': bands,
+        'rows': rows,
+        'threshold': threshold,
+        'candidate_pairs': int(len(lefts)),
+        'exact_pairs': len(exact),
+        'found_pairs': len(found & exact),
+        'recall': len(found & exact) / len(exact) if exact else 1.0,
+        'seconds': seconds,
+        'labels_per_second': len(token_sets) / seconds if seconds > 0 else float('inf'),
+        'peak_memory_bytes': peak,
+    }
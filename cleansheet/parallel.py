@@ -0,0 +1,146 @@
+"""Run grouping and standardization on a pool of worker processes.
+
+Variant buckets are grouped independently and groups are standardized
+independently, so both stages are split into tasks and scheduled largest
+first. Each worker receives the names and their extracted features once,
+through the pool initializer; tasks then only carry positions into that
+list. Results are put back in the serial order, so the output is
+identical to a run with ``workers=1``.
+"""
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from .engine import (
+    FeatureCache,
+    GroupProfile,
+    ProductFeatures,
+    _greedy_groups,
+    _union_find_groups,
+    score_confidence,
+    standardize_product_name,
+)
+
+# Tasks per worker when packing many small buckets or groups into tasks
+_TASKS_PER_WORKER = 8
+
+_worker_names = None
+_worker_features = None
+_worker_config = None
+
+
+def _init_worker(names, records, config):
+    global _worker_names, _worker_features, _worker_config
+    _worker_names = names
+    _worker_features = FeatureCache(
+        (name, ProductFeatures.from_record(name, record)) for name, record in zip(names, records))
+    _worker_config = config
+
+
+def _group_buckets_task(buckets):
+    """Group a batch of variant buckets, returning each bucket's groups as positions and the pair counters"""
+    results = []
+    counts = Counter()
+    for positions in buckets:
+        local = {_worker_names[position]: position for position in positions}
+        bucket = [_worker_features[_worker_names[position]] for position in positions]
+        if _worker_config.clustering == 'union_find':
+            groups = _union_find_groups(bucket, _worker_config, counts)
+        else:
+            groups = _greedy_groups(bucket, _worker_config, counts)
+        results.append([[local[name] for name in group] for group in groups])
+    return results, counts
+
+
+def _standardize_task(groups):
+    """Standardize a batch of groups, returning ``(standardized_name, confidence)`` per member"""
+    results = []
+    for positions in groups:
+        group = [_worker_names[position] for position in positions]
+        profile = GroupProfile(group, _worker_features)
+        members = []
+        for name in group:
+            std_name = standardize_product_name(name, group, _worker_features, profile)
+            confidence = score_confidence(_worker_features[name], _worker_features[std_name], _worker_config)
+            # None stands for "kept the original label", so non-string
+            # labels such as NaN come back as the very same object
+            members.append((None if std_name is name else std_name, confidence))
+        results.append(members)
+    return results
+
+
+def _pack(groups, workers):
+    """Batch the indices of buckets or groups into tasks, largest first and large ones on their own"""
+    order = sorted(range(len(groups)), key=lambda index: -len(groups[index]))
+    target = max(1, sum(len(group) for group in groups) // (workers * _TASKS_PER_WORKER))
+    tasks = []
+    current = []
+    current_size = 0
+    for index in order:
+        current.append(index)
+        current_size += len(groups[index])
+        if current_size >= target:
+            tasks.append(current)
+            current = []
+            current_size = 0
+    if current:
+        tasks.append(current)
+    return tasks
+
+
+def _in_order(batches, task_results):
+    """One result per batch, in the order of ``batches``, from ``(task, results)`` pairs"""
+    results = [None] * len(batches)
+    for task, task_result in task_results:
+        for index, result in zip(task, task_result):
+            results[index] = result
+    return results
+
+
+class WorkerPool:
+    """Process pool preloaded with the features of a fixed list of names"""
+
+    def __init__(self, product_names, features, config):
+        self.config = config
+        self.names = list(dict.fromkeys(product_names))
+        self.positions = {name: position for position, name in enumerate(self.names)}
+        records = [features[name].to_record() for name in self.names]
+        self.executor = ProcessPoolExecutor(max_workers=config.workers, initializer=_init_worker,
+                                            initargs=(self.names, records, config))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+
+    def group_buckets(self, buckets, counts=None):
+        """Group each bucket of names, in the order given
+
+        Pair counters of the workers are added to ``counts`` when given.
+        """
+        names = self.names
+        task_results = self._run(_group_buckets_task, buckets)
+        if counts is not None:
+            for _, (_, task_counts) in task_results:
+                counts.update(task_counts)
+        results = _in_order(buckets, [(task, groups) for task, (groups, _) in task_results])
+        return [[[names[position] for position in group] for group in groups] for groups in results]
+
+    def _run(self, function, batches):
+        """Apply ``function`` to packed tasks of name lists and return ``(task, result)`` per task"""
+        positions = self.positions
+        tasks = _pack(batches, self.config.workers)
+        futures = [self.executor.submit(function, [[positions[name] for name in batches[index]] for index in task])
+                   for task in tasks]
+        return [(task, future.result()) for task, future in zip(tasks, futures)]
+
+    def standardize(self, groups):
+        """``(standardized_name, confidence)`` for every member of every group"""
+        results = _in_order(groups, self._run(_standardize_task, groups))
+        return [[(name if std_name is None else std_name, confidence)
+                 for name, (std_name, confidence) in zip(group, members)]
+                for group, members in zip(groups, results)]
@@ -0,0 +1,342 @@
+"""DataFrame-level pipeline: match labels across files and aggregate metrics."""
+
+from collections import Counter
+from dataclasses import dataclass, replace
+
+import numpy as np
+import pandas as pd
+
+from .config import DEFAULT_CONFIG
+from .engine import create_standardized_mapping
+from .formats import read_batches
+from .profiling import RunProfile
+
+# Rows per chunk when streaming CSV files
+DEFAULT_CHUNKSIZE = 100_000
+
+
+def _report(progress, percent, message):
+    if progress is not None:
+        progress(percent, message)
+
+
+def unique_products(sales_df, inventory_df):
+    """Distinct labels of both frames, in first-seen order"""
+    return pd.concat([
+        sales_df['Product'].drop_duplicates(),
+        inventory_df['Product'].drop_duplicates()
+    ]).drop_duplicates().tolist()
+
+
+def process_files(sales_df, inventory_df, config=None, progress=None, store=None, graph=None, run_profile=None):
+    """Process the sales and inventory files to create matched output
+
+    Both frames must already use the ``Product`` label column and the
+    ``Sales (£)`` / ``Inventory Units`` metric columns. ``progress`` is an
+    optional ``callable(percent, message)`` used by the UI progress bar and
+    ``store`` an optional :class:`~cleansheet.store.MatchStore` of earlier
+    results. A :class:`~cleansheet.graph.MatchGraph` built for the same
+    labels is re-cut instead of matching from scratch when it covers
+    ``config``. Stage timings and counters are added to ``run_profile`` (a
+    :class:`~cleansheet.profiling.RunProfile`) when given. A categorical
+    ``Product`` column is mapped through its codes without hashing each row.
+    """
+    config = config or DEFAULT_CONFIG
+    if run_profile is None:
+        run_profile = RunProfile()
+
+    # Extract all unique product names
+    with run_profile.stage('unique labels'):
+        all_products = unique_products(sales_df, inventory_df)
+
+    _report(progress, 0, "Creating standardized mapping...")
+
+    # Create standardized mapping
+    if graph is not None and graph.covers(config, all_products):
+        std_mapping, confidence_scores = graph.mapping(config, run_profile)
+    else:
+        std_mapping, confidence_scores = create_standardized_mapping(all_products, config, store, run_profile)
+
+    _report(progress, 50, "Applying mapping to data...")
+
+    with run_profile.stage('summary'):
+        summary_df = _summary_frame(std_mapping, confidence_scores, config)
+    matched_df = _matched_frame(sales_df, inventory_df, std_mapping, run_profile)
+
+    _report(progress, 100, "Processing complete!")
+
+    return matched_df, summary_df
+
+
+def _summary_frame(std_mapping, confidence_scores, config):
+    """Matching Map: one row per original label"""
+    summary_df = pd.DataFrame({
+        'Product': list(std_mapping.keys()),
+        'Standardized Name': [std_mapping[p] for p in std_mapping.keys()],
+        'Confidence': [confidence_scores[p] for p in std_mapping.keys()]
+    })
+
+    # Add flag for manual review if confidence is low
+    summary_df['Flag'] = summary_df['Confidence'].apply(
+        lambda x: "Manual Review Needed" if x < config.manual_review_threshold else ""
+    )
+    return summary_df
+
+
+def _matched_frame(sales_df, inventory_df, std_mapping, run_profile=None):
+    """Clean View: sales and inventory totals per standardized name
+
+    Rows are mapped to integer group ids through their label codes and
+    summed with :func:`numpy.bincount`; standardized names are only
+    attached to the final totals.
+    """
+    if run_profile is None:
+        run_profile = RunProfile()
+
+    # Map every row to the group id of its standardized name
+    with run_profile.stage('mapping'):
+        names, label_groups = _label_groups(std_mapping)
+        sales_groups = _row_groups(sales_df['Product'], label_groups)
+        inventory_groups = _row_groups(inventory_df['Product'], label_groups)
+
+    # Sum per group id and keep the names that have rows in either file
+    with run_profile.stage('aggregation'):
+        sales, sales_seen = _group_sums(sales_groups, sales_df['Sales (£)'], len(names))
+        inventory, inventory_seen = _group_sums(inventory_groups, inventory_df['Inventory Units'], len(names))
+        order = _name_order(names, sales_seen | inventory_seen)
+        matched_df = pd.DataFrame({
+            'Standardized Name': names[order],
+            'Sales (£)': _outer_totals(sales, sales_seen, order),
+            'Inventory Units': _outer_totals(inventory, inventory_seen, order),
+        })
+    run_profile.count('rows', len(sales_df) + len(inventory_df))
+    return matched_df
+
+
+def _label_groups(std_mapping):
+    """Distinct standardized names and the group id of every label
+
+    Labels whose standardized name is missing get no group, so their rows
+    are left out of the totals like ``groupby`` leaves out missing keys.
+    """
+    groups = {}
+    label_groups = {}
+    for label, std_name in std_mapping.items():
+        if std_name is None or std_name != std_name:
+            continue
+        label_groups[label] = groups.setdefault(std_name, len(groups))
+    names = pd.Series(list(groups), dtype=object).to_numpy()
+    return names, label_groups
+
+
+def _row_groups(labels, label_groups):
+    """Group id of every row of ``labels``, or -1 for rows without a standardized name
+
+    Labels are factorized once (categorical columns reuse their codes), so
+    the mapping dict is only consulted once per distinct label.
+    """
+    codes, uniques = pd.factorize(labels)
+    lookup = np.fromiter((label_groups.get(label, -1) for label in uniques), dtype=np.intp, count=len(uniques))
+    # Missing labels have code -1, which picks the trailing -1
+    return np.append(lookup, -1)[codes]
+
+
+def _group_sums(groups, values, count):
+    """``(sums, seen)``: per-group totals of a metric column and which groups have rows"""
+    keep = groups >= 0
+    groups = groups[keep]
+    seen = np.bincount(groups, minlength=count) > 0
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biuf':
+        values = values.to_numpy()[keep]
+        if values.dtype.kind == 'f':
+            # Missing values count as 0, as in groupby sums
+            return np.bincount(groups, weights=np.where(np.isnan(values), 0, values), minlength=count), seen
+        if np.abs(values, dtype=np.float64).sum() < 2 ** 53:
+            # Every partial sum is exact in float64 below 2**53
+            return np.bincount(groups, weights=values, minlength=count).astype(np.int64), seen
+        sums = np.zeros(count, dtype=np.int64)
+        np.add.at(sums, groups, values.astype(np.int64))
+        return sums, seen
+
+    # Object and extension columns keep groupby semantics
+    sums = values[keep].groupby(groups).sum().reindex(range(count), fill_value=0)
+    return sums.array, seen
+
+
+def _name_order(names, seen):
+    """Positions of the seen names, sorted by name as groupby sorts its keys"""
+    present = np.flatnonzero(seen)
+    ranks, _ = pd.factorize(names[present], sort=True)
+    return present[np.argsort(ranks, kind='stable')]
+
+
+def _outer_totals(sums, seen, order):
+    """Totals in ``order``; 0 for names without rows, as float like an outer merge filled with 0"""
+    totals = sums[order]
+    missing = ~seen[order]
+    if missing.any():
+        if isinstance(totals, np.ndarray) and totals.dtype.kind in 'biu':
+            totals = totals.astype(np.float64)
+        totals[missing] = 0
+    return totals
+
+
+@dataclass(frozen=True)
+class Source:
+    """One input of :func:`reconcile`
+
+    ``data`` is a DataFrame, or a CSV, Parquet or Arrow IPC path or
+    seekable buffer that is streamed in chunks (see
+    :mod:`cleansheet.formats`; ``fmt`` overrides the format taken from the
+    file extension). ``name`` labels its metric columns in the output when
+    several sources use the same metric column name.
+    """
+
+    data: object
+    label_col: str
+    metric_cols: tuple
+    name: str = None
+    fmt: str = None
+
+
+def _as_source(source):
+    if not isinstance(source, Source):
+        source = Source(*source)
+    if isinstance(source.metric_cols, str):
+        source = replace(source, metric_cols=(source.metric_cols,))
+    return source
+
+
+def output_columns(sources):
+    """Output metric column names of every source, in order
+
+    A metric keeps its column name unless another source uses the same
+    name, in which case the source name (or ``File n``) is appended.
+    """
+    sources = [_as_source(source) for source in sources]
+    counts = Counter(metric for source in sources for metric in source.metric_cols)
+    columns = []
+    for number, source in enumerate(sources, 1):
+        source_name = source.name or f"File {number}"
+        columns.append([metric if counts[metric] == 1 else f"{metric} ({source_name})"
+                        for metric in source.metric_cols])
+    return columns
+
+
+def _chunks(source, columns, chunksize):
+    """The selected columns of a source, as one frame or as streamed chunks"""
+    if isinstance(source.data, pd.DataFrame):
+        return [source.data[list(columns)]]
+    return read_batches(source.data, columns, chunksize, source.fmt)
+
+
+def _unique_labels(source, chunksize, labels):
+    """First pass: add the distinct labels of one source to ``labels`` in first-seen order"""
+    for chunk in _chunks(source, [source.label_col], chunksize):
+        for label in chunk[source.label_col].drop_duplicates().tolist():
+            # Missing labels (NaN from CSV, None from Arrow) all share one key
+            labels.setdefault(np.nan if pd.isna(label) else label, None)
+
+
+def _aggregate(sources, columns, std_mapping, chunksize, run_profile):
+    """Second pass: one wide frame of per-standardized-name totals for every metric
+
+    Each chunk is mapped to group ids and added to running totals with
+    :func:`numpy.bincount`, so memory does not grow with the number of rows.
+    """
+    names, label_groups = _label_groups(std_mapping)
+    seen = np.zeros(len(names), dtype=bool)
+    totals = {}
+    integer = {}
+    for source, source_columns in zip(sources, columns):
+        for chunk in _chunks(source, [source.label_col, *source.metric_cols], chunksize):
+            run_profile.count('rows', len(chunk))
+            groups = _row_groups(chunk[source.label_col], label_groups)
+            for metric, column in zip(source.metric_cols, source_columns):
+                sums, chunk_seen = _group_sums(groups, chunk[metric], len(names))
+                seen |= chunk_seen
+                integer[column] = integer.get(column, True) and pd.api.types.is_integer_dtype(sums)
+                totals[column] = sums if column not in totals else totals[column] + sums
+
+    order = _name_order(names, seen)
+    matched_df = pd.DataFrame({'Standardized Name': names[order]})
+    for column in (column for source_columns in columns for column in source_columns):
+        if column not in totals:
+            matched_df[column] = np.zeros(len(order))
+        elif integer[column]:
+            # Combining sources with different names goes through float
+            matched_df[column] = np.asarray(totals[column][order]).astype('int64')
+        else:
+            matched_df[column] = totals[column][order]
+    return matched_df
+
+
+def reconcile(sources, config=None, progress=None, store=None, chunksize=DEFAULT_CHUNKSIZE, run_profile=None):
+    """Match the labels of any number of sources once and aggregate all their metrics
+
+    ``sources`` is a list of :class:`Source` objects or
+    ``(data, label_col, metric_cols)`` tuples. The labels of all sources
+    are matched together in one run, then every metric is summed per
+    standardized name into one wide frame with a ``Standardized Name``
+    column followed by the metric columns (see :func:`output_columns`).
+    Names missing from a source get 0. CSV sources are streamed
+    ``chunksize`` rows at a time and read only the selected columns.
+    Returns ``(matched_df, summary_df)`` like :func:`process_files`; stage
+    timings and counters go to ``run_profile`` when given. Streamed reads
+    are timed with the ``unique labels`` and ``aggregation`` stages.
+    """
+    config = config or DEFAULT_CONFIG
+    if run_profile is None:
+        run_profile = RunProfile()
+    sources = [_as_source(source) for source in sources]
+    columns = output_columns(sources)
+
+    _report(progress, 0, "Collecting unique labels...")
+
+    labels = {}
+    with run_profile.stage('unique labels'):
+        for source in sources:
+            _unique_labels(source, chunksize, labels)
+
+    _report(progress, 20, "Creating standardized mapping...")
+
+    std_mapping, confidence_scores = create_standardized_mapping(list(labels), config, store, run_profile)
+    del labels
+
+    _report(progress, 60, "Aggregating metrics...")
+
+    with run_profile.stage('summary'):
+        summary_df = _summary_frame(std_mapping, confidence_scores, config)
+    with run_profile.stage('aggregation'):
+        matched_df = _aggregate(sources, columns, std_mapping, chunksize, run_profile)
+
+    _report(progress, 100, "Processing complete!")
+
+    return matched_df, summary_df
+
+
+def process_csv_files(sales_csv, inventory_csv, sales_columns=('Product', 'Sales (£)'),
+                      inventory_columns=('Product', 'Inventory Units'), config=None,
+                      progress=None, store=None, chunksize=DEFAULT_CHUNKSIZE, run_profile=None):
+    """Streaming version of :func:`process_files` for CSVs too large to load
+
+    ``sales_csv`` and ``inventory_csv`` are paths or seekable buffers
+    (Parquet and Arrow IPC files work too, see :class:`Source`) and
+    each ``*_columns`` pair names the label and metric column of that file.
+    Each file is read twice, ``chunksize`` rows at a time and only the two
+    selected columns: once to collect the distinct labels for matching and
+    once to add up the metric per standardized name. Peak memory grows with
+    the number of distinct labels, not rows. Returns the same frames as
+    :func:`process_files`.
+    """
+    sources = [
+        Source(sales_csv, sales_columns[0], (sales_columns[1],)),
+        Source(inventory_csv, inventory_columns[0], (inventory_columns[1],)),
+    ]
+    (sales_metric,), (inventory_metric,) = output_columns(sources)
+    matched_df, summary_df = reconcile(sources, config, progress, store, chunksize, run_profile)
+    matched_df = matched_df.rename(columns={
+        sales_metric: 'Sales (£)',
+        inventory_metric: 'Inventory Units'
+    })
+    return matched_df, summary_df
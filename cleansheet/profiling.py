@@ -0,0 +1,77 @@
+"""Per-stage timings and hot-path counters of one matching run.
+
+Pass a :class:`RunProfile` as ``run_profile`` to
+:func:`~cleansheet.pipeline.process_files`,
+:func:`~cleansheet.pipeline.reconcile` or
+:func:`~cleansheet.engine.create_standardized_mapping` to find out which
+stage made a run slow::
+
+    run_profile = RunProfile()
+    matched_df, summary_df = process_files(sales_df, inventory_df, config, run_profile=run_profile)
+    print(run_profile.to_dict())
+
+Stages add up wall and CPU time over every time they are entered.
+Counters cover candidate pairs, similarity scores, conflict rejections and
+regular expression passes; histograms count variant bucket and group sizes
+in power-of-two bins. With ``workers > 1`` pair counters are collected from
+the workers, but regular expressions run there are not counted.
+"""
+
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+def size_bin(size):
+    """Power-of-two histogram bin of a size, e.g. ``'1'``, ``'2'``, ``'3-4'``, ``'5-8'``"""
+    if size <= 2:
+        return str(size)
+    upper = 1 << (size - 1).bit_length()
+    return f"{upper // 2 + 1}-{upper}"
+
+
+class RunProfile:
+    """Wall and CPU time per stage, counters and size histograms of one run"""
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = Counter()
+        self.histograms = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Time the body of a ``with`` block as stage ``name``"""
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'cpu_seconds': 0.0, 'calls': 0})
+            stage['seconds'] += time.perf_counter() - start_wall
+            stage['cpu_seconds'] += time.process_time() - start_cpu
+            stage['calls'] += 1
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def histogram(self, name, sizes):
+        """Add ``sizes`` to the power-of-two histogram ``name``"""
+        histogram = self.histograms.setdefault(name, Counter())
+        for size in sizes:
+            histogram[size_bin(size)] += 1
+
+    @property
+    def total_seconds(self):
+        return sum(stage['seconds'] for stage in self.stages.values())
+
+    def to_dict(self):
+        """Plain, JSON-serialisable form of the profile"""
+        return {
+            'stages': {name: dict(stage) for name, stage in self.stages.items()},
+            'counters': dict(self.counters),
+            'histograms': {
+                name: dict(sorted(histogram.items(), key=lambda item: int(item[0].split('-')[0])))
+                for name, histogram in self.histograms.items()
+            },
+            'total_seconds': self.total_seconds,
+        }
@@ -0,0 +1,67 @@
+"""Batch Jaccard scoring with scipy sparse matrices.
+
+Labels are encoded as a binary label x token matrix. Intersections for a
+block of rows come from one sparse matrix product, union sizes from the
+row sums, so the per-pair Python set operations disappear from the hot
+loop. Peak memory is bounded by ``block_size`` rows of the product.
+"""
+
+import numpy as np
+from scipy import sparse
+
+DEFAULT_BLOCK_SIZE = 2048
+
+
+def token_matrix(token_sets):
+    """Encode token sets as a binary CSR matrix (one row per set)"""
+    vocabulary = {}
+    indptr = [0]
+    indices = []
+    for tokens in token_sets:
+        for token in tokens:
+            indices.append(vocabulary.setdefault(token, len(vocabulary)))
+        indptr.append(len(indices))
+
+    data = np.ones(len(indices), dtype=np.int32)
+    shape = (len(token_sets), max(len(vocabulary), 1))
+    return sparse.csr_matrix((data, np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)), shape=shape)
+
+
+def iter_similar_pairs(token_sets, threshold, block_size=DEFAULT_BLOCK_SIZE):
+    """Yield ``(rows, cols, scores)`` arrays for pairs ``i < j`` with Jaccard >= threshold
+
+    Pairs without any shared token are never produced, so ``threshold``
+    must be greater than zero.
+    """
+    if threshold <= 0:
+        raise ValueError("sparse scoring needs a positive similarity threshold")
+
+    matrix = token_matrix(token_sets)
+    sizes = np.asarray(matrix.sum(axis=1)).ravel().astype(np.int64)
+    count = matrix.shape[0]
+
+    for start in range(0, count, block_size):
+        stop = min(start + block_size, count)
+
+        # Only columns >= start can hold pairs with j > i for this block
+        intersections = (matrix[start:stop] @ matrix[start:].T).tocoo()
+        rows = intersections.row.astype(np.int64) + start
+        cols = intersections.col.astype(np.int64) + start
+        shared = intersections.data.astype(np.int64)
+
+        upper = cols > rows
+        rows, cols, shared = rows[upper], cols[upper], shared[upper]
+
+        scores = shared / (sizes[rows] + sizes[cols] - shared)
+        keep = scores >= threshold
+        yield rows[keep], cols[keep], scores[keep]
+
+
+def neighbour_lists(token_sets, threshold, block_size=DEFAULT_BLOCK_SIZE):
+    """For every position, the ascending positions after it with Jaccard >= threshold"""
+    neighbours = [[] for _ in token_sets]
+    for rows, cols, _ in iter_similar_pairs(token_sets, threshold, block_size):
+        order = np.lexsort((cols, rows))
+        for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+            neighbours[row].append(col)
+    return neighbours
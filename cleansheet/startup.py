@@ -0,0 +1,61 @@
+"""Measure how long the engine takes to start in a fresh interpreter.
+
+Run ``python -m cleansheet.startup`` to print a JSON report with the bare
+interpreter start-up time, the time to import the engine, the time of the
+first tokenization call and whether NLTK got imported. Useful to catch
+import-time regressions such as heavy dependencies or corpus downloads
+creeping back in.
+"""
+
+import json
+import subprocess
+import sys
+import time
+
+_PROBE = '''
+import sys
+import time
+start = time.perf_counter()
+import cleansheet.engine as engine
+imported = time.perf_counter()
+engine.extract_tokens("Samsung TV 32in Smart")
+first_call = time.perf_counter()
+print(imported - start, first_call - imported, int('nltk' in sys.modules))
+'''
+
+
+def _run(code):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            capture_output=True, text=True).stdout
+    return time.perf_counter() - start, output
+
+
+def measure_startup(repeat=5):
+    """Return the best-of-``repeat`` start-up timings in seconds"""
+    bare = min(_run('pass')[0] for _ in range(repeat))
+
+    runs = []
+    for _ in range(repeat):
+        total, output = _run(_PROBE)
+        import_seconds, first_call_seconds, nltk_imported = (float(value) for value in output.split())
+        runs.append((total, import_seconds, first_call_seconds, bool(nltk_imported)))
+
+    total, import_seconds, first_call_seconds, nltk_imported = min(runs)
+    return {
+        'interpreter_seconds': bare,
+        'process_seconds': total,
+        'import_seconds': import_seconds,
+        'first_tokenize_seconds': first_call_seconds,
+        'nltk_imported': nltk_imported,
+        'repeat': repeat,
+    }
+
+
+def main():
+    report = measure_startup()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
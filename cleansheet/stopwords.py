@@ -0,0 +1,55 @@
+"""Stopword handling for tokenization.
+
+The English list is built in (it matches NLTK's ``stopwords.words('english')``)
+so tokenization needs neither NLTK nor a corpus download. A different list
+can be loaded from a plain text file, one word per line, either with
+:func:`load_stop_words` or by pointing the ``CLEANSHEET_STOPWORDS``
+environment variable at the file.
+"""
+
+ENGLISH_STOP_WORDS = frozenset([
+    'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', "you're",
+    "you've", "you'll", "you'd", 'your', 'yours', 'yourself', 'yourselves', 'he', 'him',
+    'his', 'himself', 'she', "she's", 'her', 'hers', 'herself', 'it', "it's", 'its',
+    'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which', 'who',
+    'whom', 'this', 'that', "that'll", 'these', 'those', 'am', 'is', 'are', 'was',
+    'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does', 'did',
+    'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until',
+    'while', 'of', 'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into',
+    'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up',
+    'down', 'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further', 'then',
+    'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all', 'any', 'both',
+    'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only',
+    'own', 'same', 'so', 'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don',
+    "don't", 'should', "should've", 'now', 'd', 'll', 'm', 'o', 're', 've', 'y', 'ain',
+    'aren', "aren't", 'couldn', "couldn't", 'didn', "didn't", 'doesn', "doesn't",
+    'hadn', "hadn't", 'hasn', "hasn't", 'haven', "haven't", 'isn', "isn't", 'ma',
+    'mightn', "mightn't", 'mustn', "mustn't", 'needn', "needn't", 'shan', "shan't",
+    'shouldn', "shouldn't", 'wasn', "wasn't", 'weren', "weren't", 'won', "won't",
+    'wouldn', "wouldn't",
+])
+
+
+def load_stop_words(path):
+    """Read a stopword file (one word per line, ``#`` starts a comment)"""
+    words = set()
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            word = line.split('#', 1)[0].strip().lower()
+            if word:
+                words.add(word)
+    return frozenset(words)
+
+
+def nltk_stop_words(language='english'):
+    """Load a stopword list from the optional NLTK corpus
+
+    NLTK is not required by the engine; it is only imported here. Nothing
+    is downloaded, so the corpus must already be installed.
+    """
+    try:
+        from nltk.corpus import stopwords
+    except ImportError as exc:
+        raise ImportError("NLTK is not installed; install it with 'pip install nltk' "
+                          "or use the built-in stopword list") from exc
+    return frozenset(stopwords.words(language))
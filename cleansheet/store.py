@@ -0,0 +1,247 @@
+"""Persistent on-disk cache of match results (SQLite).
+
+Entries are keyed by the lowercased label and a hash of every setting that
+can change a result, including :data:`~cleansheet.engine.RULE_VERSION` and
+the active stopword list. Every feature is extracted from the lowercased
+label, so labels that share a key get the same result; punctuation is kept
+because it decides how sizes are read ("500-ml" vs "500 ml"). Each entry
+stores the standardized name, the confidence and the label's extracted
+features; labels that kept their original spelling are stored with an empty
+name, so each spelling gets itself back. The store is trimmed to ``max_bytes`` of payload by
+evicting the least recently used entries.
+
+Command line::
+
+    python -m cleansheet.store matches.db stats
+    python -m cleansheet.store matches.db invalidate
+    python -m cleansheet.store matches.db evict --max-bytes 50000000
+"""
+
+import argparse
+import dataclasses
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+
+from .config import DEFAULT_CONFIG
+from .engine import RULE_VERSION, get_stop_words
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Settings that never change a label's standardized name or confidence
+_RESULT_NEUTRAL_SETTINGS = ('manual_review_threshold', 'block_size', 'workers')
+
+# SQLite limits the number of bound parameters per statement
+_BATCH_SIZE = 500
+
+# Bumped whenever the label key changes, so older entries are never matched
+_LABEL_KEY_VERSION = 2
+
+# Standardized name stored for labels that kept their original spelling
+_KEPT_LABEL = ''
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS matches (
+    label_key TEXT NOT NULL,
+    settings_key TEXT NOT NULL,
+    standardized_name TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    features TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (label_key, settings_key)
+);
+CREATE INDEX IF NOT EXISTS matches_last_used ON matches (last_used);
+'''
+
+
+def settings_key(config=None):
+    """Hash of the settings and rules that determine a label's match result"""
+    config = config or DEFAULT_CONFIG
+    settings = {name: value for name, value in dataclasses.asdict(config).items()
+                if name not in _RESULT_NEUTRAL_SETTINGS}
+    settings['rule_version'] = RULE_VERSION
+    settings['stop_words'] = sorted(get_stop_words())
+    payload = json.dumps(settings, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+
+def _entry_settings_key(config=None):
+    """Settings key of store entries, including the label key version"""
+    payload = f"{settings_key(config)}/{_LABEL_KEY_VERSION}".encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+
+def label_key(label):
+    """Store key of a label, or None for labels that are never stored"""
+    if not isinstance(label, str):
+        return None
+    return label.lower() if label.strip() else None
+
+
+class MatchStore:
+    """SQLite-backed store of per-label match results"""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.connection = sqlite3.connect(path)
+        # Freed pages are returned to the OS after eviction
+        self.connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        self.connection.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _rows(self, labels, config, columns):
+        """Yield ``(labels, row)`` for every cached label key, in batches"""
+        key = _entry_settings_key(config)
+        by_label_key = {}
+        for label in labels:
+            entry_key = label_key(label)
+            if entry_key is not None:
+                by_label_key.setdefault(entry_key, []).append(label)
+
+        label_keys = list(by_label_key)
+        for start in range(0, len(label_keys), _BATCH_SIZE):
+            batch = label_keys[start:start + _BATCH_SIZE]
+            placeholders = ', '.join('?' * len(batch))
+            rows = self.connection.execute(
+                f'SELECT label_key, {columns} FROM matches '
+                f'WHERE settings_key = ? AND label_key IN ({placeholders})',
+                [key, *batch]).fetchall()
+            for row in rows:
+                yield by_label_key[row[0]], row
+
+    def lookup(self, labels, config=None):
+        """Return ``{label: (standardized_name, confidence)}`` for cached labels"""
+        key = _entry_settings_key(config)
+        found = {}
+        used = []
+        for matching_labels, (entry_key, standardized_name, confidence) in self._rows(
+                labels, config, 'standardized_name, confidence'):
+            used.append(entry_key)
+            for label in matching_labels:
+                found[label] = (label if standardized_name == _KEPT_LABEL else standardized_name, confidence)
+
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                'UPDATE matches SET last_used = ? WHERE settings_key = ? AND label_key = ?',
+                [(now, key, entry_key) for entry_key in used])
+        return found
+
+    def features(self, labels, config=None):
+        """Return ``{label: feature record}`` for cached labels (see ``ProductFeatures.to_record``)"""
+        found = {}
+        for matching_labels, (_, record) in self._rows(labels, config, 'features'):
+            for label in matching_labels:
+                found[label] = json.loads(record)
+        return found
+
+    def save(self, results, config=None):
+        """Store ``(label, standardized_name, confidence, features)`` results, then evict
+
+        A standardized name that is the label itself (``is``) is stored as
+        "kept the original label". Keys whose labels got different results
+        in the same batch are not stored, and any older entry for them is
+        dropped.
+        """
+        key = _entry_settings_key(config)
+        now = time.time()
+        rows = {}
+        conflicting = set()
+        for label, standardized_name, confidence, features in results:
+            entry_key = label_key(label)
+            if entry_key is None or not isinstance(standardized_name, str):
+                continue
+            if standardized_name is label:
+                standardized_name = _KEPT_LABEL
+            record = json.dumps(features.to_record(), separators=(',', ':'))
+            size = len(entry_key) + len(standardized_name) + len(record) + len(key) + 16
+            row = (entry_key, key, standardized_name, confidence, record, size, now)
+            if rows.setdefault(entry_key, row) != row:
+                conflicting.add(entry_key)
+
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [row for entry_key, row in rows.items() if entry_key not in conflicting])
+            self.connection.executemany(
+                'DELETE FROM matches WHERE label_key = ? AND settings_key = ?',
+                [(entry_key, key) for entry_key in conflicting])
+        self.evict()
+
+    def evict(self, max_bytes=None):
+        """Drop least recently used entries until the payload fits ``max_bytes``"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        total = self.connection.execute('SELECT COALESCE(SUM(bytes), 0) FROM matches').fetchone()[0]
+        if total <= max_bytes:
+            return 0
+
+        excess = total - max_bytes
+        rows = self.connection.execute(
+            'SELECT label_key, settings_key, bytes FROM matches ORDER BY last_used')
+        victims = []
+        for label_key, key, size in rows:
+            if excess <= 0:
+                break
+            victims.append((label_key, key))
+            excess -= size
+        with self.connection:
+            self.connection.executemany(
+                'DELETE FROM matches WHERE label_key = ? AND settings_key = ?', victims)
+        self._release_free_pages()
+        return len(victims)
+
+    def invalidate(self, config=None):
+        """Delete cached results for one configuration, or everything when ``config`` is None"""
+        with self.connection:
+            if config is None:
+                cursor = self.connection.execute('DELETE FROM matches')
+            else:
+                cursor = self.connection.execute(
+                    'DELETE FROM matches WHERE settings_key = ?', (_entry_settings_key(config),))
+        self._release_free_pages()
+        return cursor.rowcount
+
+    def _release_free_pages(self):
+        # executescript runs the pragma to completion; execute() would only
+        # step it once and free a single page
+        self.connection.executescript('PRAGMA incremental_vacuum;')
+
+    def stats(self):
+        """Entry count, payload bytes and number of distinct settings in the store"""
+        entries, total, settings = self.connection.execute(
+            'SELECT COUNT(*), COALESCE(SUM(bytes), 0), COUNT(DISTINCT settings_key) FROM matches').fetchone()
+        return {'entries': entries, 'bytes': total, 'settings': settings, 'max_bytes': self.max_bytes}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m cleansheet.store',
+                                     description='Inspect or clear a CleanSheet match store.')
+    parser.add_argument('path', help='SQLite store file')
+    parser.add_argument('command', choices=['stats', 'invalidate', 'evict'])
+    parser.add_argument('--max-bytes', type=int, default=DEFAULT_MAX_BYTES,
+                        help='payload budget used by "evict"')
+    args = parser.parse_args(argv)
+
+    with MatchStore(args.path, max_bytes=args.max_bytes) as store:
+        if args.command == 'invalidate':
+            print(f"Removed {store.invalidate()} cached matches")
+        elif args.command == 'evict':
+            print(f"Evicted {store.evict()} cached matches")
+        print(json.dumps(store.stats(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
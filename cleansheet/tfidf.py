@@ -0,0 +1,109 @@
+"""TF-IDF character n-gram similarity with blocked sparse top-k neighbours.
+
+Each label is encoded from its tokens (the :func:`~cleansheet.engine.preprocess_text`
+output without stopwords) as a TF-IDF vector of character n-grams taken
+within word boundaries, so "Sam TV" and "Samsung TV" share most of their
+weight even though only one of their tokens matches. Vectors are L2
+normalised, so the product of two rows is their cosine similarity. Rows are
+multiplied against the whole matrix ``block_size`` rows at a time and only
+the ``top_k`` strongest neighbours at or above the threshold are kept for
+each row; a pair is a match when either side keeps the other. Needs
+scikit-learn.
+"""
+
+import numpy as np
+from scipy import sparse
+
+DEFAULT_NGRAM = 3
+DEFAULT_TOP_K = 20
+DEFAULT_BLOCK_SIZE = 2048
+
+
+def _texts(token_sets):
+    # Sorted so the encoding only depends on the set, like Jaccard
+    return [' '.join(sorted(tokens)) for tokens in token_sets]
+
+
+def ngram_matrix(token_sets, ngram=DEFAULT_NGRAM):
+    """Encode token sets as L2-normalised TF-IDF character n-gram rows (CSR)"""
+    try:
+        from sklearn.feature_extraction.text import TfidfVectorizer
+    except ImportError:
+        raise ImportError("The tfidf pair engine needs scikit-learn: pip install scikit-learn") from None
+
+    texts = _texts(token_sets)
+    if not any(texts):
+        return sparse.csr_matrix((len(texts), 1), dtype=np.float64)
+    vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=(ngram, ngram), lowercase=False,
+                                 sublinear_tf=True, dtype=np.float64)
+    return vectorizer.fit_transform(texts).tocsr()
+
+
+def iter_top_k(matrix, threshold, top_k=DEFAULT_TOP_K, block_size=DEFAULT_BLOCK_SIZE):
+    """Yield ``(rows, cols, scores)`` arrays of each row's ``top_k`` neighbours with cosine >= threshold
+
+    Neighbours of a row are ranked by score, ties going to the lower
+    position. Pairs without a shared n-gram are never produced, so
+    ``threshold`` must be greater than zero.
+    """
+    if threshold <= 0:
+        raise ValueError("tfidf scoring needs a positive similarity threshold")
+
+    transposed = matrix.T.tocsr()
+    count = matrix.shape[0]
+    for start in range(0, count, block_size):
+        stop = min(start + block_size, count)
+
+        products = (matrix[start:stop] @ transposed).tocoo()
+        rows = products.row.astype(np.int64) + start
+        cols = products.col.astype(np.int64)
+        # Rounding can put identical rows a hair above 1
+        scores = np.minimum(products.data, 1.0)
+
+        keep = (rows != cols) & (scores >= threshold)
+        rows, cols, scores = rows[keep], cols[keep], scores[keep]
+
+        # Strongest first within each row, then keep the first top_k of each run
+        order = np.lexsort((cols, -scores, rows))
+        rows, cols, scores = rows[order], cols[order], scores[order]
+        rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        keep = rank < top_k
+        yield rows[keep], cols[keep], scores[keep]
+
+
+class NgramIndex:
+    """TF-IDF n-gram vectors of one list of token sets, with neighbour and pair scores"""
+
+    def __init__(self, token_sets, ngram=DEFAULT_NGRAM, block_size=DEFAULT_BLOCK_SIZE):
+        self.matrix = ngram_matrix(token_sets, ngram)
+        self.block_size = block_size
+        # position -> {later position: score} once neighbours are searched
+        self.neighbours = None
+        self._row_position = None
+        self._row = None
+
+    def neighbour_lists(self, threshold, top_k=DEFAULT_TOP_K):
+        """For every position, the ascending later positions it matches with
+
+        A pair matches when either position keeps the other among its
+        ``top_k`` neighbours at or above ``threshold``.
+        """
+        neighbours = [{} for _ in range(self.matrix.shape[0])]
+        for rows, cols, scores in iter_top_k(self.matrix, threshold, top_k, self.block_size):
+            lefts = np.minimum(rows, cols)
+            rights = np.maximum(rows, cols)
+            for left, right, score in zip(lefts.tolist(), rights.tolist(), scores.tolist()):
+                neighbours[left].setdefault(right, score)
+        self.neighbours = [dict(sorted(later.items())) for later in neighbours]
+        return [list(later) for later in self.neighbours]
+
+    def similarity(self, i, j):
+        """Cosine similarity of two positions"""
+        left, right = min(i, j), max(i, j)
+        if self.neighbours is not None and right in self.neighbours[left]:
+            return self.neighbours[left][right]
+        # Callers walk the pairs of one position at a time, so keep its row
+        if self._row_position != left:
+            self._row = (self.matrix[left] @ self.matrix.T).toarray().ravel()
+            self._row_position = left
+        return min(float(self._row[right]), 1.0)
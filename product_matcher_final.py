@@ -1,23 +1,15 @@
+import hashlib
+import io
 import streamlit as st
-import pandas as pd
 import numpy as np
-import re
-from collections import defaultdict, Counter
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
+import pandas as pd
 import time
-import os
-
-# Download NLTK resources if not already downloaded
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt', quiet=True)
-try:
-    nltk.data.find('corpora/stopwords')
-except LookupError:
-    nltk.download('stopwords', quiet=True)
+
+from cleansheet import MatchConfig
+from cleansheet.formats import detect_format, read_columns, read_table, write_table
+from cleansheet.graph import MatchGraph
+from cleansheet.pipeline import process_files as run_pipeline, unique_products
+from cleansheet.profiling import RunProfile
 
 # Set page configuration
 st.set_page_config(
@@ -446,15 +438,15 @@ st.sidebar.markdown('''
 ''', unsafe_allow_html=True)
 
 sales_file = st.sidebar.file_uploader(
-    "Upload File 1 (CSV)",
-    type=["csv"],
-    help="CSV file containing labels and metric data"
+    "Upload File 1 (CSV, Parquet or Arrow)",
+    type=["csv", "parquet", "arrow", "feather"],
+    help="CSV, Parquet or Arrow IPC file containing labels and metric data"
 )
 
 inventory_file = st.sidebar.file_uploader(
-    "Upload File 2 (CSV)",
-    type=["csv"],
-    help="CSV file containing labels and metric data"
+    "Upload File 2 (CSV, Parquet or Arrow)",
+    type=["csv", "parquet", "arrow", "feather"],
+    help="CSV, Parquet or Arrow IPC file containing labels and metric data"
 )
 
 # Advanced settings
@@ -472,6 +464,27 @@ min_similarity = st.sidebar.slider(
     help="Minimum similarity threshold for considering products as matches. Higher values require more token matches."
 )
 
+pair_engine = st.sidebar.selectbox(
+    "Pair Scoring Engine",
+    options=["index", "sparse", "minhash", "tfidf"],
+    format_func=lambda engine: {
+        "index": "Token index",
+        "sparse": "Sparse matrix (batch)",
+        "minhash": "MinHash LSH (approximate)",
+        "tfidf": "TF-IDF character n-grams"
+    }[engine],
+    help="How candidate pairs are scored. The sparse matrix engine scores pairs in batches and is faster on large files. "
+         "MinHash LSH is fastest on very large catalogs but may miss a small share of matches. "
+         "TF-IDF compares parts of words, so abbreviations such as \"Sam TV\" and \"Samsung TV\" can match."
+)
+
+clustering = st.sidebar.selectbox(
+    "Grouping Method",
+    options=["greedy", "union_find"],
+    format_func=lambda method: {"greedy": "Greedy (input order)", "union_find": "Union-find (order-independent)"}[method],
+    help="Greedy grouping depends on the order of rows in your files. Union-find gives the same groups for any row order."
+)
+
 st.sidebar.markdown('<div class="sidebar-subheader"><span class="sidebar-icon">🛡️</span> Protection Settings</div>', unsafe_allow_html=True)
 
 variant_protection = st.sidebar.checkbox(
@@ -494,594 +507,42 @@ manual_review_threshold = st.sidebar.slider(
     help="Confidence score below which products are flagged for manual review. Lower values flag more items."
 )
 
-# Helper functions for text preprocessing
-def preprocess_text(text):
-    """Clean and normalize text for better matching"""
-    if not isinstance(text, str):
-        return ""
-
-    # Convert to lowercase
-    text = text.lower()
-
-    # Replace special characters with spaces
-    text = re.sub(r'[^\w\s]', ' ', text)
-
-    # Replace underscores with spaces
-    text = text.replace('_', ' ')
-
-    # Normalize spaces
-    text = re.sub(r'\s+', ' ', text).strip()
-
-    return text
-
-def extract_tokens(product_name):
-    """Extract meaningful tokens from product name"""
-    if not isinstance(product_name, str):
-        return []
-
-    # Preprocess the text
-    text = preprocess_text(product_name)
-
-    # Simple tokenization by splitting on spaces
-    tokens = text.split()
-
-    # Remove stopwords
-    stop_words = set(stopwords.words('english'))
-    tokens = [token for token in tokens if token not in stop_words]
-
-    return tokens
-
-def extract_size_info(product_name):
-    """Extract size information from product name"""
-    if not isinstance(product_name, str):
-        return None
-
-    # Preprocess the product name to handle concatenated tokens
-    # Insert spaces before digits to help with pattern matching
-    processed_name = re.sub(r'([a-zA-Z])(\d)', r'\1 \2', product_name.lower())
-
-    # Look for common size patterns
-    size_patterns = [
-        r'(\d+)\s*in',  # e.g., 32in, 32 in
-        r'(\d+)\s*inch',  # e.g., 32inch, 32 inch
-        r'(\d+)\s*ml',  # e.g., 330ml, 330 ml
-        r'(\d+)\s*l\b',  # e.g., 1l, 1 l
-        r'(\d+)l\b',  # e.g., 1l, 2l
-        r'(\d+)\s*oz',  # e.g., 16oz, 16 oz
-        r'(\d+)\s*gb',  # e.g., 64gb, 64 gb
-        r'(\d+)\s*tb',  # e.g., 1tb, 1 tb
-        r'(\d+)\s*kg',  # e.g., 1kg, 1 kg
-        r'(\d+)\s*g\b',  # e.g., 200g, 200 g
-        r'(\d+)g\b',  # e.g., 200g
-    ]
-
-    # Try both the original and processed names
-    for name in [product_name.lower(), processed_name]:
-        for pattern in size_patterns:
-            match = re.search(pattern, name)
-            if match:
-                return match.group(1)
-
-    # Also check for standalone numbers that might be sizes
-    # Only include standalone numbers if they're likely to be sizes (e.g., 13, 32, 40, 50)
-    size_numbers = ['13', '32', '40', '50', '55', '65', '75']
-    tokens = product_name.lower().split()
-    for token in tokens:
-        if token in size_numbers:
-            return token
-
-    return None
-
-def extract_size_unit(product_name):
-    """Extract size unit from product name"""
-    if not isinstance(product_name, str):
-        return None
-
-    # Preprocess the product name to handle concatenated tokens
-    # Insert spaces before digits to help with pattern matching
-    processed_name = re.sub(r'([a-zA-Z])(\d)', r'\1 \2', product_name.lower())
-
-    # Look for common unit patterns
-    unit_patterns = [
-        (r'\d+\s*(in|inch)', 'in'),
-        (r'\d+\s*(ml)', 'ml'),
-        (r'\d+\s*(l)\b', 'L'),
-        (r'\d+l\b', 'L'),
-        (r'\d+\s*(oz)', 'oz'),
-        (r'\d+\s*(gb)', 'GB'),
-        (r'\d+\s*(tb)', 'TB'),
-        (r'\d+\s*(kg)', 'kg'),
-        (r'\d+\s*(g)\b', 'g'),
-        (r'\d+g\b', 'g'),
-    ]
-
-    # Try both the original and processed names
-    for name in [product_name.lower(), processed_name]:
-        for pattern, unit in unit_patterns:
-            if re.search(pattern, name):
-                return unit
-
-    return None
-
-def extract_variant_tokens(product_name):
-    """Extract all variant tokens (size, volume, weight) that should be treated as hard split conditions"""
-    if not isinstance(product_name, str):
-        return []
-
-    # Preprocess the product name to handle concatenated tokens
-    # Insert spaces before digits to help with pattern matching
-    processed_name = re.sub(r'([a-zA-Z])(\d)', r'\1 \2', product_name.lower())
-
-    # Look for all variant tokens
-    variant_patterns = [
-        # Volume patterns
-        r'(\d+\s*ml)',  # e.g., 500ml, 500 ml
-        r'(\d+\s*l\b)',  # e.g., 2L, 2 L
-        r'(\d+l\b)',  # e.g., 2L
-        r'(\d+\s*oz)',  # e.g., 16oz, 16 oz
-
-        # Weight patterns
-        r'(\d+\s*kg)',  # e.g., 1kg, 1 kg
-        r'(\d+\s*g\b)',  # e.g., 200g, 200 g
-        r'(\d+g\b)',  # e.g., 200g
-
-        # Size patterns
-        r'(\d+\s*in)',  # e.g., 32in, 32 in
-        r'(\d+\s*inch)',  # e.g., 32inch, 32 inch
-        r'(\d+\s*gb)',  # e.g., 64gb, 64 gb
-        r'(\d+\s*tb)',  # e.g., 1tb, 1 tb
-    ]
-
-    variant_tokens = []
-
-    # Apply patterns to both original and processed names
-    for name in [product_name.lower(), processed_name]:
-        for pattern in variant_patterns:
-            matches = re.findall(pattern, name)
-            variant_tokens.extend([match.strip() for match in matches])
-
-    # Also check for standalone numbers that might be sizes
-    # Only include standalone numbers if they're likely to be sizes (e.g., 13, 32, 40, 50)
-    size_numbers = ['13', '32', '40', '50', '55', '65', '75']
-
-    # Check in both original tokens and processed tokens
-    for name in [product_name.lower(), processed_name]:
-        tokens = name.split()
-        for token in tokens:
-            if token in size_numbers:
-                variant_tokens.append(token)
-
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_tokens = []
-    for token in variant_tokens:
-        if token not in seen:
-            seen.add(token)
-            unique_tokens.append(token)
-
-    return unique_tokens
-
-def extract_brand(product_name):
-    """Extract potential brand name from product name"""
-    if not isinstance(product_name, str):
-        return None
-
-    # Common brand names to look for
-    common_brands = [
-        'samsung', 'apple', 'sony', 'lg', 'coca-cola', 'coke', 'pepsi',
-        'microsoft', 'dell', 'hp', 'lenovo', 'asus', 'acer', 'toshiba'
-    ]
-
-    tokens = extract_tokens(product_name)
-
-    # Check if any token matches a common brand
-    for token in tokens:
-        if token.lower() in common_brands:
-            return token
-
-    # If no match, assume first token might be brand
-    if tokens:
-        return tokens[0]
-
-    return None
-
-def extract_variant_info(product_name):
-    """Extract variant information from product name"""
-    if not isinstance(product_name, str):
-        return []
-
-    # Common variant keywords
-    variant_keywords = [
-        'pro', 'mini', 'max', 'plus', 'basic', 'smart', 'vanilla', 'zero',
-        'premium', 'standard', 'lite', 'ultra', 'gold', 'silver', 'black', 'white'
-    ]
-
-    tokens = extract_tokens(product_name.lower())
-    variants = [token for token in tokens if token in variant_keywords]
-
-    return variants
-
-def calculate_token_similarity(name1, name2):
-    """Calculate similarity based on shared tokens"""
-    tokens1 = set(extract_tokens(name1))
-    tokens2 = set(extract_tokens(name2))
-
-    if not tokens1 or not tokens2:
-        return 0.0
-
-    # Calculate Jaccard similarity
-    intersection = len(tokens1.intersection(tokens2))
-    union = len(tokens1.union(tokens2))
-
-    return intersection / union if union > 0 else 0.0
-
-def check_variant_conflict(name1, name2):
-    """Check if there's a variant conflict between two product names"""
-    if not variant_protection:
-        return False
-
-    variants1 = extract_variant_info(name1)
-    variants2 = extract_variant_info(name2)
-
-    # If both have variants but they don't match, it's a conflict
-    if variants1 and variants2 and not set(variants1).intersection(set(variants2)):
-        return True
-
-    return False
-
-def check_size_conflict(name1, name2):
-    """Check if there's a size conflict between two product names"""
-    if not size_protection:
-        return False
-
-    # First check using the traditional size extraction
-    size1 = extract_size_info(name1)
-    size2 = extract_size_info(name2)
-
-    # If both have sizes but they don't match, it's a conflict
-    if size1 and size2 and size1 != size2:
-        return True
-
-    # Now check using the variant tokens approach for more comprehensive protection
-    variant_tokens1 = extract_variant_tokens(name1)
-    variant_tokens2 = extract_variant_tokens(name2)
-
-    # If both have variant tokens but they don't share any, it's a conflict
-    if variant_tokens1 and variant_tokens2:
-        # Check if there's any overlap in variant tokens
-        if not set(variant_tokens1).intersection(set(variant_tokens2)):
-            return True
-
-    return False
-
-def standardize_product_name(product_name, product_group):
-    """Generate a standardized name for a product based on its group"""
-    if not product_group:
-        return product_name
-
-    # Extract common tokens across the group
-    all_tokens = []
-    all_variants = []
-    all_sizes = []
-    all_size_units = []
-    all_brands = []
-
-    # Extract variant tokens for the specific product - will be used for size/unit extraction
-
-    for name in product_group:
-        all_tokens.extend(extract_tokens(name))
-        all_variants.extend(extract_variant_info(name))
-
-        size = extract_size_info(name)
-        if size:
-            all_sizes.append(size)
-
-        size_unit = extract_size_unit(name)
-        if size_unit:
-            all_size_units.append(size_unit)
-
-        brand = extract_brand(name)
-        if brand:
-            all_brands.append(brand)
-
-    # Count token frequencies
-    token_counts = Counter(all_tokens)
-    variant_counts = Counter(all_variants)
-    size_counts = Counter(all_sizes)
-    size_unit_counts = Counter(all_size_units)
-    brand_counts = Counter(all_brands)
-
-    # For this specific product, use its own size/variant tokens
-    # instead of the most common ones from the group
-    product_size = extract_size_info(product_name)
-    product_size_unit = extract_size_unit(product_name)
-
-    # Get the most common size only if this product doesn't have one
-    common_size = product_size if product_size else (size_counts.most_common(1)[0][0] if size_counts else None)
-
-    # Get the most common size unit only if this product doesn't have one
-    common_size_unit = product_size_unit if product_size_unit else (size_unit_counts.most_common(1)[0][0] if size_unit_counts else None)
-
-    # Check if the specific product has a variant
-    product_variants = extract_variant_info(product_name)
-
-    # Build standardized name
-    std_name_parts = []
-
-    # Format based on product type
-    if any('tv' in token.lower() for token in all_tokens):
-        # Samsung TV format: "Samsung TV 32in Smart"
-        std_name_parts.append('Samsung')
-        std_name_parts.append('TV')
-
-        # Add size - use the product's own size if available
-        product_size = extract_size_info(product_name)
-
-        if product_size:
-            std_name_parts.append(f"{product_size}in")
-        elif common_size:
-            std_name_parts.append(f"{common_size}in")
-
-        # Add variant
-        if 'smart' in product_name.lower() or any(name for name in product_group if 'smart' in name.lower() and calculate_token_similarity(name, product_name) > 0.7):
-            std_name_parts.append('Smart')
-        elif 'basic' in product_name.lower() or any(name for name in product_group if 'basic' in name.lower() and calculate_token_similarity(name, product_name) > 0.7):
-            std_name_parts.append('Basic')
-        elif len(variant_counts) > 1 or not any(v for v in ['smart', 'basic'] if v in ' '.join(all_tokens).lower()):
-            std_name_parts.append('(Unspecified Variant)')
-
-    elif any('iphone' in token.lower() for token in all_tokens) or any('apple' in token.lower() for token in all_tokens):
-        # iPhone format: "Apple iPhone 13 Pro"
-        std_name_parts.append('Apple')
-        std_name_parts.append('iPhone')
-
-        # Add model number - check in the specific product first
-        product_tokens = extract_tokens(product_name)
-        model_added = False
-
-        for token in product_tokens:
-            if token.isdigit():
-                std_name_parts.append(token)
-                model_added = True
-                break
-
-        # If no model found in the product, look in the group
-        if not model_added and any(token.isdigit() for token in all_tokens):
-            for token in all_tokens:
-                if token.isdigit():
-                    std_name_parts.append(token)
-                    break
-
-        # Add variant - prioritize the product's own variant
-        if 'pro' in product_name.lower():
-            std_name_parts.append('Pro')
-        elif 'mini' in product_name.lower():
-            std_name_parts.append('Mini')
-        elif any(name for name in product_group if 'pro' in name.lower() and calculate_token_similarity(name, product_name) > 0.7):
-            std_name_parts.append('Pro')
-        elif any(name for name in product_group if 'mini' in name.lower() and calculate_token_similarity(name, product_name) > 0.7):
-            std_name_parts.append('Mini')
-        elif len(variant_counts) > 1 or not any(v for v in ['pro', 'mini'] if v in ' '.join(all_tokens).lower()):
-            std_name_parts.append('(Unspecified Variant)')
-
-    elif any('coca' in token.lower() for token in all_tokens) or any('cola' in token.lower() for token in all_tokens):
-        # Coca-Cola format: "Coca-Cola 330ml Vanilla"
-        std_name_parts.append('Coca-Cola')
-
-        # Add size - use the product's own size if available
-        product_size = extract_size_info(product_name)
-        product_size_unit = extract_size_unit(product_name)
-
-        if product_size and product_size_unit:
-            # Use the product's own size and unit
-            if product_size_unit.lower() == 'ml':
-                std_name_parts.append(f"{product_size}ml")
-            elif product_size_unit.lower() == 'l':
-                std_name_parts.append(f"{product_size}L")
-        elif common_size:
-            # Fallback to common size if product doesn't have one
-            if any('ml' in token.lower() for token in all_tokens):
-                std_name_parts.append(f"{common_size}ml")
-            elif any('l' in token.lower() for token in all_tokens):
-                std_name_parts.append(f"{common_size}L")
-
-        # Add variant
-        if 'vanilla' in product_name.lower() or any(name for name in product_group if 'vanilla' in name.lower() and calculate_token_similarity(name, product_name) > 0.7):
-            std_name_parts.append('Vanilla')
-        elif 'zero' in product_name.lower() or any(name for name in product_group if 'zero' in name.lower() and calculate_token_similarity(name, product_name) > 0.7):
-            std_name_parts.append('Zero')
-
-    else:
-        # Generic format - use the original approach
-        # Get the most common brand
-        common_brand = brand_counts.most_common(1)[0][0] if brand_counts else None
-
-        # Get the most common tokens (excluding brand, size, and variants)
-        exclude_tokens = set()
-        if common_brand:
-            exclude_tokens.add(common_brand.lower())
-        if common_size:
-            exclude_tokens.add(common_size.lower())
-        for variant in all_variants:
-            exclude_tokens.add(variant.lower())
-
-        common_tokens = [token for token, count in token_counts.most_common()
-                        if count > len(product_group) / 3 and token.lower() not in exclude_tokens]
-
-        # Add brand if available
-        if common_brand:
-            std_name_parts.append(common_brand.title())
-
-        # Add common tokens
-        std_name_parts.extend([token.title() for token in common_tokens[:2]])
-
-        # Add size if available - use the product's own size if available
-        product_size = extract_size_info(product_name)
-        product_size_unit = extract_size_unit(product_name)
-
-        if product_size and product_size_unit:
-            std_name_parts.append(f"{product_size}{product_size_unit}")
-        elif product_size:
-            std_name_parts.append(f"{product_size}")
-        elif common_size and common_size_unit:
-            std_name_parts.append(f"{common_size}{common_size_unit}")
-        elif common_size:
-            std_name_parts.append(f"{common_size}")
-
-        # Add specific variant if available
-        if product_variants:
-            std_name_parts.append(product_variants[0].title())
-        elif variant_counts:
-            # If no specific variant but multiple variants exist in the group
-            if len(variant_counts) > 1:
-                std_name_parts.append("(Unspecified Variant)")
-            else:
-                # Add the most common variant
-                std_name_parts.append(variant_counts.most_common(1)[0][0].title())
-
-    # Join all parts
-    std_name = " ".join(std_name_parts)
-
-    # If we couldn't generate a good name, fallback to original
-    if not std_name or len(std_name_parts) < 2:
-        return product_name
-
-    return std_name
-
-def group_similar_products(product_names):
-    """Group similar product names together"""
-    groups = []
-
-    # First, pre-process products to extract variant tokens
-    product_variants = {}
-    for name in product_names:
-        product_variants[name] = extract_variant_tokens(name)
-
-    # Group products by variant tokens first
-    variant_groups = {}
-    for name, variants in product_variants.items():
-        # Create a key from sorted variant tokens
-        variant_key = tuple(sorted(variants)) if variants else ('no_variants',)
-        if variant_key not in variant_groups:
-            variant_groups[variant_key] = []
-        variant_groups[variant_key].append(name)
-
-    # Now process each variant group separately
-    for variant_key, variant_products in variant_groups.items():
-        # Skip processing if there's only one product in this variant group
-        if len(variant_products) == 1:
-            groups.append(variant_products)
-            continue
-
-        # Process products within this variant group
-        variant_assigned = set()
-        for i, name1 in enumerate(variant_products):
-            if i in variant_assigned:
-                continue
-
-            current_group = [name1]
-            variant_assigned.add(i)
-
-            for j, name2 in enumerate(variant_products):
-                if j in variant_assigned or i == j:
-                    continue
-
-                # Check for conflicts (still check variant conflicts for other variant types)
-                if check_variant_conflict(name1, name2):
-                    continue
-
-                # Calculate similarity
-                similarity = calculate_token_similarity(name1, name2)
-
-                if similarity >= min_similarity:
-                    current_group.append(name2)
-                    variant_assigned.add(j)
-
-            groups.append(current_group)
-
-    return groups
-
-def create_standardized_mapping(product_names):
-    """Create a mapping from original names to standardized names"""
-    groups = group_similar_products(product_names)
-    mapping = {}
-    confidence_scores = {}
-
-    for group in groups:
-        # Create standardized names for each product in the group
-        for name in group:
-            std_name = standardize_product_name(name, group)
-            mapping[name] = std_name
-
-            # Calculate confidence score
-            confidence = calculate_token_similarity(name, std_name)
-
-            # Adjust based on whether variants and sizes match
-            if check_variant_conflict(name, std_name):
-                confidence *= 0.5
-
-            if check_size_conflict(name, std_name):
-                confidence *= 0.5
-
-            confidence_scores[name] = confidence
-
-    return mapping, confidence_scores
-
-def process_files(sales_df, inventory_df):
-    """Process the sales and inventory files to create matched output"""
-    start_time = time.time()
+# Build the engine configuration from the sidebar settings
+match_config = MatchConfig(
+    min_similarity=min_similarity,
+    variant_protection=variant_protection,
+    size_protection=size_protection,
+    manual_review_threshold=manual_review_threshold,
+    pair_engine=pair_engine,
+    clustering=clustering
+)
 
-    # Extract all unique product names
-    all_products = pd.concat([
-        sales_df['Product'].drop_duplicates(),
-        inventory_df['Product'].drop_duplicates()
-    ]).drop_duplicates().tolist()
+def process_files(sales_df, inventory_df, run_profile):
+    """Run the matching pipeline with a progress bar, recording stage timings in ``run_profile``"""
+    start_time = time.time()
 
     # Create progress bar
     progress_bar = st.progress(0)
     status_text = st.empty()
 
-    try:
-        # Update status
-        status_text.text("Creating standardized mapping...")
-
-        # Create standardized mapping
-        std_mapping, confidence_scores = create_standardized_mapping(all_products)
-
-        # Update progress
-        progress_bar.progress(50)
-        status_text.text("Applying mapping to data...")
-
-        # Create summary dataframe
-        summary_df = pd.DataFrame({
-            'Product': list(std_mapping.keys()),
-            'Standardized Name': [std_mapping[p] for p in std_mapping.keys()],
-            'Confidence': [confidence_scores[p] for p in std_mapping.keys()]
-        })
-
-        # Add flag for manual review if confidence is low
-        summary_df['Flag'] = summary_df['Confidence'].apply(
-            lambda x: "Manual Review Needed" if x < manual_review_threshold else ""
-        )
-
-        # Apply mapping to sales and inventory dataframes
-        sales_df['Standardized Name'] = sales_df['Product'].map(std_mapping)
-        inventory_df['Standardized Name'] = inventory_df['Product'].map(std_mapping)
-
-        # Group by standardized name and aggregate
-        sales_agg = sales_df.groupby('Standardized Name')['Sales (£)'].sum().reset_index()
-        inventory_agg = inventory_df.groupby('Standardized Name')['Inventory Units'].sum().reset_index()
-
-        # Merge the aggregated dataframes
-        matched_df = pd.merge(sales_agg, inventory_agg, on='Standardized Name', how='outer')
+    def report_progress(percent, message):
+        progress_bar.progress(percent)
+        status_text.text(message)
 
-        # Fill NaN values with 0
-        matched_df = matched_df.fillna(0)
-
-        # Update progress
-        progress_bar.progress(100)
+    try:
+        # Score candidate pairs once per set of labels; threshold and
+        # protection changes then only re-cut the cached graph
+        graph = st.session_state.get('match_graph')
+        if match_config.min_similarity > 0:
+            all_products = unique_products(sales_df, inventory_df)
+            if graph is None or not graph.covers(match_config, all_products):
+                report_progress(0, "Scoring candidate pairs...")
+                graph = MatchGraph(all_products, match_config, run_profile=run_profile)
+                st.session_state['match_graph'] = graph
+
+        matched_df, summary_df = run_pipeline(sales_df, inventory_df, match_config, progress=report_progress,
+                                              graph=graph, run_profile=run_profile)
         status_text.text(f"Processing complete! ({time.time() - start_time:.2f} seconds)")
-
         return matched_df, summary_df
 
     finally:
@@ -1090,12 +551,102 @@ def process_files(sales_df, inventory_df):
         progress_bar.empty()
         status_text.empty()
 
+# Parsed uploads are shared across reruns and sessions, keyed by content hash
+@st.cache_data(max_entries=6, show_spinner=False)
+def load_columns(content_hash, file_name, _content):
+    """Read the column names of an upload once per distinct file content"""
+    return read_columns(io.BytesIO(_content), detect_format(file_name))
+
+@st.cache_data(max_entries=6, show_spinner=False)
+def load_table(content_hash, file_name, columns, _content):
+    """Parse only the selected columns of an upload, once per content and selection
+
+    The first column is the label column and is kept as text.
+    """
+    return read_table(io.BytesIO(_content), list(dict.fromkeys(columns)), detect_format(file_name),
+                      label_col=columns[0])
+
+# Match results are kept per session for the last few inputs and settings
+MAX_CACHED_RESULTS = 3
+
+def remember_result(key, result):
+    """Store a result in the session, dropping the oldest beyond the limit"""
+    results = st.session_state.setdefault('match_results', {})
+    results.pop(key, None)
+    results[key] = result
+    while len(results) > MAX_CACHED_RESULTS:
+        results.pop(next(iter(results)))
+
+# Run profile panel: stage timings, counters and size histograms as tables
+def profile_tables(profile):
+    """Stage, counter and histogram tables of a RunProfile dict"""
+    total = profile['total_seconds'] or 1.0
+    stages_df = pd.DataFrame([
+        {'Stage': name.capitalize(), 'Wall (s)': round(stage['seconds'], 3),
+         'CPU (s)': round(stage['cpu_seconds'], 3), 'Calls': stage['calls'],
+         'Share': f"{stage['seconds'] / total:.0%}"}
+        for name, stage in profile['stages'].items()
+    ])
+    counters_df = pd.DataFrame(
+        [{'Counter': name.replace('_', ' ').capitalize(), 'Value': value}
+         for name, value in profile['counters'].items()],
+        columns=['Counter', 'Value']
+    )
+    histograms = profile['histograms']
+    bins = list(dict.fromkeys(size for histogram in histograms.values() for size in histogram))
+    bins.sort(key=lambda size: int(size.split('-')[0]))
+    histograms_df = pd.DataFrame({
+        'Size': bins,
+        'Buckets': [histograms.get('bucket_sizes', {}).get(size, 0) for size in bins],
+        'Groups': [histograms.get('group_sizes', {}).get(size, 0) for size in bins],
+    })
+    return stages_df, counters_df, histograms_df
+
+# Matching Map grid: rows per page and cell styles matching the confidence classes above
+MAP_PAGE_SIZES = [25, 50, 100, 250]
+HIGH_CONFIDENCE_STYLE = 'color: #28a745; font-weight: 500'
+MEDIUM_CONFIDENCE_STYLE = 'color: #fd7e14; font-weight: 500'
+LOW_CONFIDENCE_STYLE = 'color: #dc3545; font-weight: 500'
+FLAG_STYLE = 'background-color: rgba(255, 193, 7, 0.1); color: #856404; font-weight: 500'
+
+def confidence_styles(confidence):
+    """CSS for a whole column of confidence scores at once"""
+    return np.select(
+        [confidence >= 0.8, confidence >= 0.6],
+        [HIGH_CONFIDENCE_STYLE, MEDIUM_CONFIDENCE_STYLE],
+        LOW_CONFIDENCE_STYLE
+    )
+
+def flag_styles(flags):
+    """CSS for a whole column of review flags at once"""
+    return np.where(flags != "", FLAG_STYLE, '')
+
+def matching_map_rows(summary_df, flagged_only, min_confidence, search, sort_by, ascending):
+    """Filter and sort the Matching Map on the server, before paging"""
+    mask = summary_df['Confidence'] >= min_confidence
+    if flagged_only:
+        mask &= summary_df['Flag'] != ""
+    if search:
+        mask &= (
+            summary_df['Product'].astype(str).str.contains(search, case=False, regex=False) |
+            summary_df['Standardized Name'].astype(str).str.contains(search, case=False, regex=False)
+        )
+    filtered_df = summary_df[mask]
+
+    # Labels can mix text and numbers, so text columns sort as strings
+    key = None if sort_by == 'Confidence' else (lambda column: column.astype(str).str.lower())
+    return filtered_df.sort_values(by=sort_by, ascending=ascending, kind='stable', key=key)
+
 # Main application logic
 if sales_file and inventory_file:
     try:
         # Load data
-        sales_df = pd.read_csv(sales_file)
-        inventory_df = pd.read_csv(inventory_file)
+        sales_content = sales_file.getvalue()
+        inventory_content = inventory_file.getvalue()
+        sales_hash = hashlib.sha256(sales_content).hexdigest()
+        inventory_hash = hashlib.sha256(inventory_content).hexdigest()
+        sales_columns = load_columns(sales_hash, sales_file.name, sales_content)
+        inventory_columns = load_columns(inventory_hash, inventory_file.name, inventory_content)
 
         # Column selection for file 1
         st.markdown('''
@@ -1114,16 +665,16 @@ if sales_file and inventory_file:
         with col1:
             sales_product_col = st.selectbox(
                 "Select Label Column (File 1)",
-                options=sales_df.columns.tolist(),
-                index=sales_df.columns.tolist().index('Product') if 'Product' in sales_df.columns else 0,
+                options=sales_columns,
+                index=sales_columns.index('Product') if 'Product' in sales_columns else 0,
                 help="e.g. Product Name, Client, SKU, Region"
             )
 
         with col2:
             sales_units_col = st.selectbox(
                 "Select Metric Column (File 1)",
-                options=sales_df.columns.tolist(),
-                index=sales_df.columns.tolist().index('Sales (£)') if 'Sales (£)' in sales_df.columns else 0,
+                options=sales_columns,
+                index=sales_columns.index('Sales (£)') if 'Sales (£)' in sales_columns else 0,
                 help="e.g. Sales, Units, Inventory, Spend"
             )
 
@@ -1144,198 +695,271 @@ if sales_file and inventory_file:
         with col1:
             inventory_product_col = st.selectbox(
                 "Select Label Column (File 2)",
-                options=inventory_df.columns.tolist(),
-                index=inventory_df.columns.tolist().index('Product') if 'Product' in inventory_df.columns else 0,
+                options=inventory_columns,
+                index=inventory_columns.index('Product') if 'Product' in inventory_columns else 0,
                 help="e.g. Product Name, Client, SKU, Region"
             )
 
         with col2:
             inventory_units_col = st.selectbox(
                 "Select Metric Column (File 2)",
-                options=inventory_df.columns.tolist(),
-                index=inventory_df.columns.tolist().index('Inventory Units') if 'Inventory Units' in inventory_df.columns else 0,
+                options=inventory_columns,
+                index=inventory_columns.index('Inventory Units') if 'Inventory Units' in inventory_columns else 0,
                 help="e.g. Sales, Units, Inventory, Spend"
             )
 
+        # Results are keyed by file contents, selected columns and settings
+        data_key = (sales_hash, inventory_hash, sales_product_col, sales_units_col,
+                    inventory_product_col, inventory_units_col)
+        result_key = (data_key, match_config)
+
         # Process button
         if st.button("Process Files", help="Click to start processing with selected columns"):
-            # Store original column names for display
-            file1_label_col = sales_product_col
-            file1_metric_col = sales_units_col
-            file2_label_col = inventory_product_col
-            file2_metric_col = inventory_units_col
-
-            # Rename columns to standardized names for processing
-            sales_df = sales_df.rename(columns={
-                sales_product_col: 'Product',
-                sales_units_col: 'Sales (£)'
-            })
-
-            inventory_df = inventory_df.rename(columns={
-                inventory_product_col: 'Product',
-                inventory_units_col: 'Inventory Units'
-            })
-
-            # Process files
-            loading_spinner = st.empty()
-            loading_text = st.empty()
-
-            with st.spinner(""):
-                loading_spinner.markdown('<div class="loading-spinner"></div>', unsafe_allow_html=True)
-                loading_text.markdown('<div style="text-align: center; margin-bottom: 2rem;">Processing your files. This may take a moment...</div>', unsafe_allow_html=True)
-                matched_df, summary_df = process_files(sales_df, inventory_df)
-
-                # Rename columns in the matched_df to use original column names
-                matched_df = matched_df.rename(columns={
-                    'Sales (£)': file1_metric_col,
-                    'Inventory Units': file2_metric_col
+            result = st.session_state.get('match_results', {}).get(result_key)
+            if result is None:
+                # Read only the selected columns
+                sales_df = load_table(sales_hash, sales_file.name, (sales_product_col, sales_units_col), sales_content)
+                inventory_df = load_table(inventory_hash, inventory_file.name,
+                                          (inventory_product_col, inventory_units_col), inventory_content)
+
+                # Rename columns to standardized names for processing
+                sales_df = sales_df.rename(columns={
+                    sales_product_col: 'Product',
+                    sales_units_col: 'Sales (£)'
                 })
 
-                # Clear the loading elements after processing is complete
-                loading_spinner.empty()
-                loading_text.empty()
-
-                # Success message
-                st.success("✅ Processing complete! Your data has been matched and standardized.")
-
-                # Display results in tabs
-                tab1, tab2 = st.tabs(["📊 Clean View", "🔍 Matching Map"])
-
-                with tab1:
-                    st.markdown('<div class="card">', unsafe_allow_html=True)
-                    st.markdown('<div class="card-header"><span class="card-icon">📊</span>Clean View</div>', unsafe_allow_html=True)
-                    st.markdown(f'<p>This view shows your standardized data with aggregated {file1_metric_col} and {file2_metric_col} values.</p>', unsafe_allow_html=True)
-
-                    # Statistics cards
-                    st.markdown('<div style="margin-bottom: 1.5rem;">', unsafe_allow_html=True)
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        st.markdown(f'''
-                        <div class="metric-container">
-                            <div class="metric-value">{len(matched_df)}</div>
-                            <div class="metric-label">Total Items</div>
-                        </div>
-                        ''', unsafe_allow_html=True)
-                    with col2:
-                        st.markdown(f'''
-                        <div class="metric-container">
-                            <div class="metric-value">{matched_df[file1_metric_col].sum():,.2f}</div>
-                            <div class="metric-label">Total {file1_metric_col}</div>
-                        </div>
-                        ''', unsafe_allow_html=True)
-                    with col3:
-                        st.markdown(f'''
-                        <div class="metric-container">
-                            <div class="metric-value">{matched_df[file2_metric_col].sum():,.0f}</div>
-                            <div class="metric-label">Total {file2_metric_col}</div>
-                        </div>
-                        ''', unsafe_allow_html=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
+                inventory_df = inventory_df.rename(columns={
+                    inventory_product_col: 'Product',
+                    inventory_units_col: 'Inventory Units'
+                })
 
-                    # Display dataframe with custom styling
-                    st.markdown('<div class="dataframe-container">', unsafe_allow_html=True)
-                    st.dataframe(
-                        matched_df.sort_values(by=file1_metric_col, ascending=False),
-                        use_container_width=True
+                # Process files
+                loading_spinner = st.empty()
+                loading_text = st.empty()
+
+                with st.spinner(""):
+                    loading_spinner.markdown('<div class="loading-spinner"></div>', unsafe_allow_html=True)
+                    loading_text.markdown('<div style="text-align: center; margin-bottom: 2rem;">Processing your files. This may take a moment...</div>', unsafe_allow_html=True)
+                    run_profile = RunProfile()
+                    matched_df, summary_df = process_files(sales_df, inventory_df, run_profile)
+
+                    # Clear the loading elements after processing is complete
+                    loading_spinner.empty()
+                    loading_text.empty()
+
+                # Store original column names for display
+                result = {
+                    'matched_df': matched_df.rename(columns={
+                        'Sales (£)': sales_units_col,
+                        'Inventory Units': inventory_units_col
+                    }),
+                    'summary_df': summary_df,
+                    'file1_label_col': sales_product_col,
+                    'file1_metric_col': sales_units_col,
+                    'file2_label_col': inventory_product_col,
+                    'file2_metric_col': inventory_units_col,
+                    'profile': run_profile.to_dict()
+                }
+                remember_result(result_key, result)
+            st.session_state['active_result'] = result_key
+
+        # Show the last processed results for these files and columns, so
+        # filters and other widgets do not throw them away
+        active_key = st.session_state.get('active_result')
+        result = None
+        if active_key is not None and active_key[0] == data_key:
+            result = st.session_state.get('match_results', {}).get(active_key)
+
+        if result is not None:
+            matched_df = result['matched_df']
+            summary_df = result['summary_df']
+            file1_label_col = result['file1_label_col']
+            file1_metric_col = result['file1_metric_col']
+            file2_label_col = result['file2_label_col']
+            file2_metric_col = result['file2_metric_col']
+
+            if active_key[1] != match_config:
+                st.info("Matching settings have changed since these results were produced. Click Process Files to update them.")
+
+            # Success message
+            st.success("✅ Processing complete! Your data has been matched and standardized.")
+
+            # Where the time went, for diagnosing slow runs
+            profile = result['profile']
+            with st.expander(f"⏱️ Run profile ({profile['total_seconds']:.2f} seconds)"):
+                stages_df, counters_df, histograms_df = profile_tables(profile)
+                st.markdown("**Stages**")
+                st.dataframe(stages_df, hide_index=True, use_container_width=True)
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.markdown("**Counters**")
+                    st.dataframe(counters_df, hide_index=True, use_container_width=True)
+                with col2:
+                    st.markdown("**Bucket and group sizes**")
+                    st.dataframe(histograms_df, hide_index=True, use_container_width=True)
+
+            # Display results in tabs
+            tab1, tab2 = st.tabs(["📊 Clean View", "🔍 Matching Map"])
+
+            with tab1:
+                st.markdown('<div class="card">', unsafe_allow_html=True)
+                st.markdown('<div class="card-header"><span class="card-icon">📊</span>Clean View</div>', unsafe_allow_html=True)
+                st.markdown(f'<p>This view shows your standardized data with aggregated {file1_metric_col} and {file2_metric_col} values.</p>', unsafe_allow_html=True)
+
+                # Statistics cards
+                st.markdown('<div style="margin-bottom: 1.5rem;">', unsafe_allow_html=True)
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.markdown(f'''
+                    <div class="metric-container">
+                        <div class="metric-value">{len(matched_df)}</div>
+                        <div class="metric-label">Total Items</div>
+                    </div>
+                    ''', unsafe_allow_html=True)
+                with col2:
+                    st.markdown(f'''
+                    <div class="metric-container">
+                        <div class="metric-value">{matched_df[file1_metric_col].sum():,.2f}</div>
+                        <div class="metric-label">Total {file1_metric_col}</div>
+                    </div>
+                    ''', unsafe_allow_html=True)
+                with col3:
+                    st.markdown(f'''
+                    <div class="metric-container">
+                        <div class="metric-value">{matched_df[file2_metric_col].sum():,.0f}</div>
+                        <div class="metric-label">Total {file2_metric_col}</div>
+                    </div>
+                    ''', unsafe_allow_html=True)
+                st.markdown('</div>', unsafe_allow_html=True)
+
+                # Display dataframe with custom styling
+                st.markdown('<div class="dataframe-container">', unsafe_allow_html=True)
+                st.dataframe(
+                    matched_df.sort_values(by=file1_metric_col, ascending=False),
+                    use_container_width=True
+                )
+                st.markdown('</div>', unsafe_allow_html=True)
+
+                # Download button with custom styling
+                # Exports are built once per result rather than on every rerun
+                if 'matched_csv' not in result:
+                    result['matched_csv'] = write_table(matched_df)
+                    result['matched_parquet'] = write_table(matched_df, fmt='parquet')
+                csv_matched = result['matched_csv']
+                col1, col2, col3, col4 = st.columns(4)
+                with col2:
+                    st.download_button(
+                        label="📥 Download Clean View",
+                        data=csv_matched,
+                        file_name=f"cleansheet_matched_{file1_metric_col}_{file2_metric_col}.csv",
+                        mime="text/csv"
+                    )
+                with col3:
+                    st.download_button(
+                        label="📥 Download as Parquet",
+                        data=result['matched_parquet'],
+                        file_name=f"cleansheet_matched_{file1_metric_col}_{file2_metric_col}.parquet",
+                        mime="application/vnd.apache.parquet",
+                        key="matched_parquet"
                     )
+                st.markdown('</div>', unsafe_allow_html=True)
+
+            with tab2:
+                st.markdown('<div class="card">', unsafe_allow_html=True)
+                st.markdown('<div class="card-header"><span class="card-icon">🔍</span>Matching Map</div>', unsafe_allow_html=True)
+                st.markdown('<p>This view shows how your original product names were mapped to standardized names, with confidence scores for each match.</p>', unsafe_allow_html=True)
+
+                # Filter options in a cleaner layout
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.markdown('<div style="background-color: white; padding: 1rem; border-radius: 8px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">', unsafe_allow_html=True)
+                    st.markdown('<div style="font-weight: 600; margin-bottom: 0.5rem; font-size: 0.9rem;">Filter Options</div>', unsafe_allow_html=True)
+                    show_flags = st.checkbox("Show only items flagged for review", value=False)
+                    min_conf = st.slider("Minimum confidence to display", 0.0, 1.0, 0.0, 0.1)
+                    search = st.text_input("Search labels", placeholder="e.g. iPhone 13")
                     st.markdown('</div>', unsafe_allow_html=True)
 
-                    # Download button with custom styling
-                    csv_matched = matched_df.to_csv(index=False)
-                    col1, col2, col3 = st.columns([1, 1, 1])
-                    with col2:
-                        st.download_button(
-                            label="📥 Download Clean View",
-                            data=csv_matched,
-                            file_name=f"cleansheet_matched_{file1_metric_col}_{file2_metric_col}.csv",
-                            mime="text/csv"
-                        )
-                    st.markdown('</div>', unsafe_allow_html=True)
+                with col2:
+                    # Statistics in a card
+                    st.markdown('<div style="background-color: white; padding: 1rem; border-radius: 8px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">', unsafe_allow_html=True)
+                    st.markdown('<div style="font-weight: 600; margin-bottom: 0.5rem; font-size: 0.9rem;">Matching Statistics</div>', unsafe_allow_html=True)
+
+                    total_mappings = len(summary_df)
+                    flagged_items = len(summary_df[summary_df['Flag'] != ""])
+                    avg_conf = summary_df['Confidence'].mean()
 
-                with tab2:
-                    st.markdown('<div class="card">', unsafe_allow_html=True)
-                    st.markdown('<div class="card-header"><span class="card-icon">🔍</span>Matching Map</div>', unsafe_allow_html=True)
-                    st.markdown('<p>This view shows how your original product names were mapped to standardized names, with confidence scores for each match.</p>', unsafe_allow_html=True)
-
-                    # Filter options in a cleaner layout
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        st.markdown('<div style="background-color: white; padding: 1rem; border-radius: 8px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">', unsafe_allow_html=True)
-                        st.markdown('<div style="font-weight: 600; margin-bottom: 0.5rem; font-size: 0.9rem;">Filter Options</div>', unsafe_allow_html=True)
-                        show_flags = st.checkbox("Show only items flagged for review", value=False)
-                        min_conf = st.slider("Minimum confidence to display", 0.0, 1.0, 0.0, 0.1)
-                        st.markdown('</div>', unsafe_allow_html=True)
-
-                    with col2:
-                        # Statistics in a card
-                        st.markdown('<div style="background-color: white; padding: 1rem; border-radius: 8px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">', unsafe_allow_html=True)
-                        st.markdown('<div style="font-weight: 600; margin-bottom: 0.5rem; font-size: 0.9rem;">Matching Statistics</div>', unsafe_allow_html=True)
-
-                        total_mappings = len(summary_df)
-                        flagged_items = len(summary_df[summary_df['Flag'] != ""])
-                        avg_conf = summary_df['Confidence'].mean()
-
-                        st.markdown(f'''
-                        <div style="display: flex; justify-content: space-between; margin-top: 0.5rem;">
-                            <div>
-                                <div style="font-size: 1.2rem; font-weight: 600; color: var(--primary-color);">{total_mappings}</div>
-                                <div style="font-size: 0.8rem; color: #666;">Total Mappings</div>
-                            </div>
-                            <div>
-                                <div style="font-size: 1.2rem; font-weight: 600; color: var(--warning);">{flagged_items}</div>
-                                <div style="font-size: 0.8rem; color: #666;">Flagged Items</div>
-                            </div>
-                            <div>
-                                <div style="font-size: 1.2rem; font-weight: 600; color: var(--accent-color);">{avg_conf:.1%}</div>
-                                <div style="font-size: 0.8rem; color: #666;">Avg. Confidence</div>
-                            </div>
+                    st.markdown(f'''
+                    <div style="display: flex; justify-content: space-between; margin-top: 0.5rem;">
+                        <div>
+                            <div style="font-size: 1.2rem; font-weight: 600; color: var(--primary-color);">{total_mappings}</div>
+                            <div style="font-size: 0.8rem; color: #666;">Total Mappings</div>
                         </div>
-                        ''', unsafe_allow_html=True)
-                        st.markdown('</div>', unsafe_allow_html=True)
-
-                    # Apply filters
-                    filtered_df = summary_df
-                    if show_flags:
-                        filtered_df = filtered_df[filtered_df['Flag'] != ""]
-                    filtered_df = filtered_df[filtered_df['Confidence'] >= min_conf]
-
-                    # Format confidence as percentage and add styling
-                    display_df = filtered_df.copy()
-
-                    # Apply custom formatting to the dataframe
-                    def format_confidence(val):
-                        if val >= 0.8:
-                            return f'<span class="high-confidence">{val:.1%}</span>'
-                        elif val >= 0.6:
-                            return f'<span class="medium-confidence">{val:.1%}</span>'
-                        else:
-                            return f'<span class="low-confidence">{val:.1%}</span>'
-
-                    def format_flag(val):
-                        if val:
-                            return f'<span class="flag-review">{val}</span>'
-                        return ""
-
-                    # Format for display
-                    display_df['Confidence'] = display_df['Confidence'].apply(format_confidence)
-                    display_df['Flag'] = display_df['Flag'].apply(format_flag)
-
-                    # Display dataframe with custom styling
-                    st.markdown('<div class="dataframe-container" style="margin-top: 1.5rem;">', unsafe_allow_html=True)
-                    st.write(display_df.sort_values(by='Confidence', ascending=False).to_html(escape=False), unsafe_allow_html=True)
+                        <div>
+                            <div style="font-size: 1.2rem; font-weight: 600; color: var(--warning);">{flagged_items}</div>
+                            <div style="font-size: 0.8rem; color: #666;">Flagged Items</div>
+                        </div>
+                        <div>
+                            <div style="font-size: 1.2rem; font-weight: 600; color: var(--accent-color);">{avg_conf:.1%}</div>
+                            <div style="font-size: 0.8rem; color: #666;">Avg. Confidence</div>
+                        </div>
+                    </div>
+                    ''', unsafe_allow_html=True)
                     st.markdown('</div>', unsafe_allow_html=True)
 
-                    # Download button with custom styling
-                    csv_summary = summary_df.to_csv(index=False)
-                    col1, col2, col3 = st.columns([1, 1, 1])
-                    with col2:
-                        st.download_button(
-                            label="📥 Download Matching Map",
-                            data=csv_summary,
-                            file_name=f"cleansheet_matching_map_{file1_label_col}_{file2_label_col}.csv",
-                            mime="text/csv"
-                        )
-                    st.markdown('</div>', unsafe_allow_html=True)
+                # Sort and page controls; filtering, sorting and paging run on the
+                # server so only the visible page is sent to the browser
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    sort_by = st.selectbox("Sort by", ['Confidence', 'Product', 'Standardized Name', 'Flag'])
+                with col2:
+                    sort_order = st.selectbox("Order", ["Descending", "Ascending"])
+                with col3:
+                    page_size = st.selectbox("Rows per page", MAP_PAGE_SIZES, index=1)
+
+                rows_df = matching_map_rows(summary_df, show_flags, min_conf, search, sort_by,
+                                            sort_order == "Ascending")
+                matching_rows = len(rows_df)
+                page_count = max(1, -(-matching_rows // page_size))
+                with col4:
+                    page = int(st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1))
+                first_row = (page - 1) * page_size
+                page_df = rows_df.iloc[first_row:first_row + page_size]
+
+                # Display the current page with vectorized styling
+                styled_page = (
+                    page_df.style
+                    .apply(confidence_styles, subset=['Confidence'])
+                    .apply(flag_styles, subset=['Flag'])
+                    .format({'Confidence': '{:.1%}'})
+                )
+                st.markdown('<div class="dataframe-container" style="margin-top: 1.5rem;">', unsafe_allow_html=True)
+                st.dataframe(styled_page, use_container_width=True, hide_index=True)
+                st.markdown('</div>', unsafe_allow_html=True)
+                st.caption(f"Showing rows {first_row + 1 if len(page_df) else 0:,}–{first_row + len(page_df):,} "
+                           f"of {matching_rows:,} matching mappings (page {page} of {page_count})")
+
+                # Download button with custom styling
+                if 'summary_csv' not in result:
+                    result['summary_csv'] = write_table(summary_df)
+                    result['summary_parquet'] = write_table(summary_df, fmt='parquet')
+                csv_summary = result['summary_csv']
+                col1, col2, col3, col4 = st.columns(4)
+                with col2:
+                    st.download_button(
+                        label="📥 Download Matching Map",
+                        data=csv_summary,
+                        file_name=f"cleansheet_matching_map_{file1_label_col}_{file2_label_col}.csv",
+                        mime="text/csv"
+                    )
+                with col3:
+                    st.download_button(
+                        label="📥 Download as Parquet",
+                        data=result['summary_parquet'],
+                        file_name=f"cleansheet_matching_map_{file1_label_col}_{file2_label_col}.parquet",
+                        mime="application/vnd.apache.parquet",
+                        key="summary_parquet"
+                    )
+                st.markdown('</div>', unsafe_allow_html=True)
 
     except Exception as e:
         st.error(f"An error occurred: {str(e)}")
@@ -1362,7 +986,7 @@ else:
             File Format Requirements
         </div>
         <p>
-            Your input files should be in CSV format. You'll be able to select which columns contain product names and values after uploading.
+            Your input files can be CSV, Parquet or Arrow IPC files. You'll be able to select which columns contain product names and values after uploading.
         </p>
     </div>
     ''', unsafe_allow_html=True)
@@ -1486,7 +1110,7 @@ Samsung TV Smart,42
             How It Works
         </div>
         <ol>
-            <li><strong>Upload your files</strong> - Provide your data in CSV format</li>
+            <li><strong>Upload your files</strong> - Provide your data as CSV, Parquet or Arrow files</li>
             <li><strong>Select columns</strong> - Choose which columns contain labels and metric values</li>
             <li><strong>Configure settings</strong> - Adjust matching parameters to suit your data</li>
             <li><strong>Process data</strong> - Our engine tokenizes, analyzes, and groups similar items</li>